@@ -0,0 +1,126 @@
+"""Local stand-ins for the external services the app calls
+
+- FakeGeminiServer answers the streamGenerateContent calls made by
+  utils.qa_gen.generate() (point GENAI_BASE_URL at it).
+- StubSentimentBackend is an in-process SentimentBackend with a fixed latency.
+- run_fake_space() serves a gradio app with the same /predict_sentiment API as
+  the real Hugging Face Space (point SENTIMENT_SPACE at it; needs `gradio`).
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LABELS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL')
+
+
+def fake_label(text):
+    """Deterministic label so repeated runs produce the same analytics"""
+    return LABELS[sum(text.encode('utf-8')) % len(LABELS)]
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    """Streams JSON {"questions": [...]} replies after `latency` seconds"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, latency=0.5, questions_per_reply=10):
+        super().__init__(('127.0.0.1', port), FakeGeminiHandler)
+        self.latency = latency
+        self.questions_per_reply = questions_per_reply
+        self.requests = 0
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def next_questions(self):
+        with self._lock:
+            self.requests += 1
+            start = next(self._counter) * self.questions_per_reply
+        # Unique texts, so the question pool never discards them as duplicates
+        return [
+            f'Benchmark question #{number}: how satisfied are you with area {number % 17}?'
+            for number in range(start, start + self.questions_per_reply)
+        ]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-gemini', daemon=True).start()
+        return self
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.latency)
+
+        text = json.dumps({'questions': self.server.next_questions()})
+        # Split the reply over two chunks like the real streaming API
+        middle = len(text) // 2
+        body = b''.join(
+            b'data: ' + json.dumps({
+                'candidates': [{'content': {'role': 'model', 'parts': [{'text': part}]}}]
+            }).encode('utf-8') + b'\r\n\r\n'
+            for part in (text[:middle], text[middle:])
+        )
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubSentimentBackend:
+    """SentimentBackend that sleeps `latency` seconds per call instead of running a model"""
+
+    latency = 0.05
+
+    def classify(self, texts, timeout):
+        if self.latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f'Sentiment analysis of {len(texts)} answers exceeded {timeout}s')
+        time.sleep(self.latency)
+        return [fake_label(text) for text in texts]
+
+
+def run_fake_space(port=7861, latency=0.05, jitter=0.0):
+    """Serve a gradio app compatible with the sentiment Space (blocks)"""
+    import gradio as gr
+
+    def predict_sentiment(text):
+        time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        return fake_label(text)
+
+    demo = gr.Interface(
+        fn=predict_sentiment,
+        inputs=gr.Textbox(label='text'),
+        outputs=gr.Textbox(label='label'),
+        api_name='predict_sentiment'
+    )
+    demo.queue(default_concurrency_limit=None).launch(server_port=port, show_error=True)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run a stand-in for an external service')
+    parser.add_argument('service', choices=('gemini', 'space'))
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    if args.service == 'space':
+        run_fake_space(port=args.port or 7861, latency=args.latency_ms / 1000)
+    else:
+        server = FakeGeminiServer(port=args.port, latency=args.latency_ms / 1000)
+        print(f'Fake Gemini API on {server.url}')
+        server.serve_forever()
@@ -0,0 +1,272 @@
+"""Load-test the app at controlled concurrency and dataset sizes
+
+    python -m benchmarks.run --surveys 1000,100000 --concurrency 1,8,32
+    python -m benchmarks.run --compare benchmarks/results/<baseline>.json
+
+For every dataset size a fresh server (benchmarks.serve) is started against an
+in-memory or real MongoDB, with the fake Gemini API and sentiment backend from
+benchmarks.fakes, and every scenario is driven at every concurrency level.
+Latency percentiles, throughput, errors and server RSS are printed and saved
+as JSON under benchmarks/results/ for later comparison.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.fakes import FakeGeminiServer
+from benchmarks.serve import make_survey
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def save_survey_request(rng):
+    survey = make_survey(f'bench-{uuid.uuid4().hex}', datetime.now(timezone.utc), rng, labelled=False)
+    return 'POST', '/api/save-survey', json.dumps(survey)
+
+
+SCENARIOS = {
+    'save-survey': save_survey_request,
+    'questions': lambda rng: ('GET', '/api/questions', None),
+    'analytics': lambda rng: ('GET', '/api/analytics/data', None),
+    'analytics-range': lambda rng: ('GET', '/api/analytics/data?granularity=week&from=2000-01-01', None),
+    'analytics-compact': lambda rng: ('GET', '/api/analytics/data?format=compact', None),
+    'analytics-range-compact': lambda rng: (
+        'GET', '/api/analytics/data?format=compact&granularity=week&from=2000-01-01', None
+    ),
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def rss_bytes(pid):
+    """Resident set size of a process, or None where it cannot be read"""
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+def drive(port, scenario, concurrency, requests, seed=0):
+    """Issue `requests` requests from `concurrency` keep-alive connections"""
+    remaining = itertools.count()
+    latencies = []
+    sizes = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        own = []
+        own_sizes = []
+        while next(remaining) < requests:
+            method, path, body = SCENARIOS[scenario](rng)
+            headers = {'Content-Type': 'application/json'} if body else {}
+            started = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                body_size = len(response.read())
+                if response.status >= 400:
+                    raise RuntimeError(f'HTTP {response.status}')
+            except Exception as e:
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                with lock:
+                    errors.append(str(e))
+                continue
+            own.append(time.perf_counter() - started)
+            own_sizes.append(body_size)
+        connection.close()
+        with lock:
+            latencies.extend(own)
+            sizes.extend(own_sizes)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies) + len(errors),
+        'errors': len(errors),
+        'sampleErrors': sorted(set(errors))[:3],
+        'seconds': round(elapsed, 3),
+        'throughput': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'p50Ms': round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        'p95Ms': round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        'p99Ms': round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        'responseBytes': round(sum(sizes) / len(sizes)) if sizes else None,
+    }
+
+
+def wait_until_ready(process, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Benchmark server exited with code {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/api/surveys')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.25)
+    raise RuntimeError(f'Benchmark server not ready after {timeout}s')
+
+
+def start_server(args, surveys, gemini_url, log):
+    command = [
+        sys.executable, '-m', 'benchmarks.serve',
+        '--port', str(args.port),
+        '--mongo', args.mongo,
+        '--database', f'survey_benchmark_{surveys}',
+        '--reset',
+        '--seed', str(surveys),
+        '--sentiment', args.sentiment,
+        '--sentiment-latency-ms', str(args.sentiment_latency_ms),
+        '--gemini-url', gemini_url,
+    ]
+    if args.write_buffer:
+        command.append('--write-buffer')
+    # Server output goes to a log file so a full pipe can never stall it
+    process = subprocess.Popen(command, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    wait_until_ready(process, args.port, args.startup_timeout)
+    return process
+
+
+def compare(results, baseline_path, tolerance):
+    """Print p95/throughput changes against a saved run; return True if p95 regressed"""
+    with open(baseline_path) as f:
+        baseline = {
+            (row['surveys'], row['scenario'], row['concurrency']): row
+            for row in json.load(f)['results']
+        }
+
+    regressed = False
+    print(f'\nCompared with {baseline_path} (tolerance {tolerance:.0%}):')
+    for row in results:
+        before = baseline.get((row['surveys'], row['scenario'], row['concurrency']))
+        if not before or not before['p95Ms'] or not row['p95Ms']:
+            continue
+        p95_change = row['p95Ms'] / before['p95Ms'] - 1
+        throughput_change = row['throughput'] / before['throughput'] - 1 if before['throughput'] else 0
+        flag = ''
+        if p95_change > tolerance:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"  {row['scenario']:>16} n={row['surveys']:<8} c={row['concurrency']:<4}"
+              f" p95 {p95_change:+.1%}  throughput {throughput_change:+.1%}{flag}")
+    return regressed
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the survey app')
+    parser.add_argument('--surveys', default='1000', help='Comma-separated dataset sizes to seed')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario and concurrency level')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--mongo', default='memory', help="'memory' (mongomock) or a MongoDB URI")
+    parser.add_argument('--sentiment', default='stub', help="'stub' or the URL of `python -m benchmarks.fakes space`")
+    parser.add_argument('--sentiment-latency-ms', type=float, default=50)
+    parser.add_argument('--gemini-latency-ms', type=float, default=800)
+    parser.add_argument('--write-buffer', action='store_true', help='Serve with the survey write buffer enabled')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--startup-timeout', type=float, default=600, help='Seconds allowed for seeding and boot')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed p95 slowdown before failing')
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+    gemini = FakeGeminiServer(latency=args.gemini_latency_ms / 1000).start()
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    output = args.output or os.path.join(RESULTS_DIR, f'{stamp}.json')
+
+    results = []
+    for surveys in [int(size) for size in args.surveys.split(',')]:
+        print(f'Seeding {surveys} surveys...', flush=True)
+        with open(os.path.join(RESULTS_DIR, f'{stamp}-server-{surveys}.log'), 'w') as log:
+            server = start_server(args, surveys, gemini.url, log)
+            try:
+                rss_idle = rss_bytes(server.pid)
+                for scenario in scenarios:
+                    # Warm up: first-use clients, question pool, analytics cache
+                    drive(args.port, scenario, 1, 5)
+                    for concurrency in [int(level) for level in args.concurrency.split(',')]:
+                        row = {
+                            'surveys': surveys,
+                            'scenario': scenario,
+                            'concurrency': concurrency,
+                            **drive(args.port, scenario, concurrency, args.requests, seed=concurrency),
+                            'rssIdleBytes': rss_idle,
+                            'rssBytes': rss_bytes(server.pid),
+                        }
+                        results.append(row)
+                        rss = f"{row['rssBytes'] / 2 ** 20:.0f}MiB" if row['rssBytes'] else 'n/a'
+                        print(f"  {scenario:>16} c={concurrency:<4} {row['throughput']:>9.1f} req/s"
+                              f"  p50 {row['p50Ms']}ms  p95 {row['p95Ms']}ms  p99 {row['p99Ms']}ms"
+                              f"  {row['responseBytes']}B  errors {row['errors']}  rss {rss}", flush=True)
+            finally:
+                server.terminate()
+                server.wait()
+
+    with open(output, 'w') as f:
+        json.dump({
+            'createdAt': stamp,
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': vars(args),
+            'geminiRequests': gemini.requests,
+            'results': results,
+        }, f, indent=2)
+    print(f'\nSaved {output}')
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""Boot the Flask app from server/__init__.py for benchmarking
+
+    python -m benchmarks.serve --port 5055 --mongo memory --sentiment stub --seed 10000
+
+Prints READY once seeded and listening. `--mongo memory` swaps pymongo's client
+for mongomock (pip install -r benchmarks/requirements.txt); any other value is
+used as the MongoDB URI, whose benchmark database `--reset` drops first.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+QUESTIONS = [
+    'How likely is it that you would recommend TSR Corporation as a place to work?',
+    'My direct manager cares about my opinions.',
+    'I am inspired by the purpose and mission of our organization.',
+    'The demands of my workload are manageable.',
+    'I understand how my work supports the goals of my team.',
+    'Team member health and wellbeing is a priority at TSR Corporation.',
+    'People from all backgrounds are treated fairly at TSR Corporation.',
+    'TSR Corporation provides AI-upskilling to enhance my productivity.',
+]
+
+ANSWERS = [
+    'I really enjoy working here and my team is great',
+    'Workload has been too heavy for months',
+    'It is fine, nothing special',
+    'My manager listens and acts on feedback',
+    'I do not feel the goals are communicated clearly',
+    'Great culture and flexible hours',
+    'Not sure yet, I joined recently',
+    'The tooling is slow and frustrating',
+    'Growth opportunities are excellent',
+    'Average, some good and some bad days',
+]
+
+
+def make_survey(survey_id, completed_at, rng, labelled=True):
+    """Synthetic survey shaped like the ones posted by static/js/survey.js"""
+    responses = []
+    for question in rng.sample(QUESTIONS, 5):
+        response = {'question': question, 'answer': rng.choice(ANSWERS)}
+        if labelled:
+            response['SentiAnalysis'] = {'label': rng.choice(('POSITIVE', 'NEGATIVE', 'NEUTRAL'))}
+        responses.append(response)
+    return {
+        'surveyId': survey_id,
+        'startedAt': (completed_at - timedelta(minutes=3)).isoformat().replace('+00:00', 'Z'),
+        'completedAt': completed_at.isoformat().replace('+00:00', 'Z'),
+        'responses': responses,
+    }
+
+
+def use_in_memory_mongo():
+    """Make every MongoClient in this process the same mongomock client"""
+    import mongomock
+    import pymongo
+    from mongomock import collection
+
+    shared = mongomock.MongoClient()
+
+    class InMemoryClient:
+        def __new__(cls, *args, **kwargs):
+            return shared
+
+    pymongo.MongoClient = InMemoryClient
+
+    # mongomock's bulk builder does not accept the `sort` argument pymongo 4.11+ passes
+    for name in ('add_update', 'add_replace', 'add_delete'):
+        original = getattr(collection.BulkOperationBuilder, name)
+
+        def without_sort(self, *args, _original=original, **kwargs):
+            kwargs.pop('sort', None)
+            return _original(self, *args, **kwargs)
+
+        setattr(collection.BulkOperationBuilder, name, without_sort)
+
+
+def seed(manager, count, days=365, chunk_size=1000):
+    """Bulk insert `count` labelled surveys spread over the last `days` days"""
+    rng = random.Random(count)
+    now = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    for start in range(0, count, chunk_size):
+        batch = [
+            make_survey(
+                f'seed-{number}',
+                now - timedelta(seconds=rng.uniform(0, days * 86400)),
+                rng
+            )
+            for number in range(start, min(start + chunk_size, count))
+        ]
+        result = manager.save_surveys(batch, chunk_size=chunk_size)
+        if result['errors']:
+            raise RuntimeError(f"Seeding failed: {result['errors'][:3]}")
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--mongo', default='memory', help="'memory' or a MongoDB URI")
+    parser.add_argument('--database', default='survey_benchmark')
+    parser.add_argument('--reset', action='store_true', help='Drop the benchmark database first')
+    parser.add_argument('--seed', type=int, default=0, help='Surveys to insert before serving')
+    parser.add_argument('--sentiment', default='stub', help="'stub' or the URL of a fake Space")
+    parser.add_argument('--sentiment-latency-ms', type=float, default=50)
+    parser.add_argument('--gemini-url', help='Base URL of the fake Gemini API')
+    parser.add_argument('--write-buffer', action='store_true', help='Coalesce survey saves (SURVEY_WRITE_BUFFER)')
+    args = parser.parse_args()
+
+    # Settings are read at import time, so configure the environment first
+    os.environ['MONGODB_DATABASE'] = args.database
+    # Nothing else writes while the rollups are built at startup
+    os.environ.setdefault('ROLLUP_REBUILD_GRACE', '0')
+    if args.mongo == 'memory':
+        os.environ['MONGODB_URI'] = 'mongodb://in-memory'
+        use_in_memory_mongo()
+    else:
+        os.environ['MONGODB_URI'] = args.mongo
+    if args.write_buffer:
+        os.environ['SURVEY_WRITE_BUFFER'] = 'true'
+    if args.gemini_url:
+        os.environ['GENAI_BASE_URL'] = args.gemini_url
+        os.environ.setdefault('GENAI_API_KEY', 'benchmark')
+    if args.sentiment == 'stub':
+        os.environ['SENTIMENT_BACKEND'] = 'stub'
+    else:
+        os.environ['SENTIMENT_BACKEND'] = 'remote'
+        os.environ['SENTIMENT_SPACE'] = args.sentiment
+
+    from benchmarks.fakes import StubSentimentBackend
+    from utils import sentiment_analysis
+    StubSentimentBackend.latency = args.sentiment_latency_ms / 1000
+    sentiment_analysis.BACKENDS['stub'] = StubSentimentBackend
+
+    from server import app
+    from database.db_utils import mongodb_manager
+
+    mongodb_manager._ensure_connection()
+    if args.reset:
+        mongodb_manager.client.drop_database(args.database)
+    mongodb_manager.ensure_indexes()
+    mongodb_manager.seed_rollups()
+    if args.seed:
+        elapsed = seed(mongodb_manager, args.seed)
+        print(f'Seeded {args.seed} surveys in {elapsed:.1f}s', file=sys.stderr)
+
+    from werkzeug.serving import make_server
+    # Per-request access logs would dominate the measurements
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server(args.host, args.port, app, threaded=True)
+    print('READY', flush=True)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
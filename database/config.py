@@ -1,12 +1,72 @@
 import os
-from google import genai
+from dotenv import load_dotenv
 
-class Config:
+# Load environment variables before any setting below is read
+load_dotenv()
 
-    model = genai.Client(
-        api_key=os.getenv("GENAI_API_KEY"),
-    )
+class Config:
 
     mongo_uri = os.getenv('MONGODB_URI')
     
-    db_name = os.getenv('MONGODB_DATABASE', 'personnel_empowerment')
\ No newline at end of file
+    db_name = os.getenv('MONGODB_DATABASE', 'personnel_empowerment')
+
+    # Connection pool and timeouts. By default every request thread of a
+    # gunicorn worker (gunicorn.conf.py) can hold a connection, plus a few for
+    # background threads (write buffer, change stream, rollup seed)
+    mongo_max_pool_size = int(os.getenv('MONGODB_MAX_POOL_SIZE', str(int(os.getenv('GUNICORN_THREADS', '200')) + 10)))
+    mongo_min_pool_size = int(os.getenv('MONGODB_MIN_POOL_SIZE', '0'))
+    mongo_server_selection_timeout_ms = int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+    mongo_connect_timeout_ms = int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', '10000'))
+    mongo_socket_timeout_ms = int(os.getenv('MONGODB_SOCKET_TIMEOUT_MS', '20000'))
+    # How often pymongo checks server health in the background
+    mongo_heartbeat_frequency_ms = int(os.getenv('MONGODB_HEARTBEAT_FREQUENCY_MS', '10000'))
+    # Backoff (seconds) between attempts when the client cannot be created at all
+    mongo_reconnect_initial_delay = float(os.getenv('MONGODB_RECONNECT_INITIAL_DELAY', '1'))
+    mongo_reconnect_max_delay = float(os.getenv('MONGODB_RECONNECT_MAX_DELAY', '60'))
+
+    # Shared (cross-worker) tier of the sentiment cache
+    sentiment_cache_shared = os.getenv('SENTIMENT_CACHE_SHARED', 'true').lower() == 'true'
+    sentiment_cache_ttl = int(os.getenv('SENTIMENT_CACHE_TTL', str(30 * 24 * 3600)))
+
+    # 'sync' labels answers inside /api/save-survey; 'async' stores them as
+    # PENDING and leaves labelling to `flask sentiment-worker`
+    sentiment_mode = os.getenv('SENTIMENT_MODE', 'sync').lower()
+
+    # Seconds a save may take from checking the rollup state to updating the
+    # counters; a rebuild waits this long before it starts reading the surveys,
+    # and again before it swaps its counters in
+    rollup_rebuild_grace = float(os.getenv('ROLLUP_REBUILD_GRACE', '5'))
+
+    # Seconds a worker may reuse the data version before re-reading it; cached
+    # analytics responses can be this much older than the latest write
+    analytics_cache_version_ttl = float(os.getenv('ANALYTICS_CACHE_VERSION_TTL', '1'))
+    # Identifies the deployed code in cached analytics responses and their
+    # ETags, so a deploy never serves bodies (or 304s) rendered by the previous
+    # release. Empty: a hash of the application's source files
+    app_release = os.getenv('APP_RELEASE', '')
+    # Share rendered analytics responses between workers through MongoDB
+    analytics_cache_shared = os.getenv('ANALYTICS_CACHE_SHARED', 'true').lower() == 'true'
+
+    # Relay live dashboard deltas between workers through a MongoDB change
+    # stream (replica sets only; otherwise each worker only sees its own writes)
+    live_updates_shared = os.getenv('LIVE_UPDATES_SHARED', 'true').lower() == 'true'
+    # Seconds between keep-alive comments on idle /api/analytics/stream connections
+    live_updates_heartbeat = float(os.getenv('LIVE_UPDATES_HEARTBEAT', '15'))
+    # Open streams per worker; each holds a gthread thread, so by default at most
+    # half of them. Further dashboards get 503 and keep polling
+    live_updates_max_streams = int(os.getenv(
+        'LIVE_UPDATES_MAX_STREAMS', str(int(os.getenv('GUNICORN_THREADS', '200')) // 2)
+    ))
+
+    # Coalesce /api/save-survey writes of each worker into bulk writes, flushed
+    # every SURVEY_WRITE_BUFFER_INTERVAL_MS or SURVEY_WRITE_BUFFER_BATCH_SIZE surveys
+    survey_write_buffer = os.getenv('SURVEY_WRITE_BUFFER', 'false').lower() == 'true'
+    survey_write_buffer_interval_ms = float(os.getenv('SURVEY_WRITE_BUFFER_INTERVAL_MS', '20'))
+    survey_write_buffer_batch_size = int(os.getenv('SURVEY_WRITE_BUFFER_BATCH_SIZE', '500'))
+    # Surveys allowed to wait for a flush; further saves are refused with 503
+    survey_write_buffer_max_pending = int(os.getenv('SURVEY_WRITE_BUFFER_MAX_PENDING', '5000'))
+    # Seconds a request waits for room in the buffer and for its flush
+    survey_write_buffer_timeout = float(os.getenv('SURVEY_WRITE_BUFFER_TIMEOUT', '30'))
+
+    # Startup (import of the server package) longer than this is logged as a warning
+    startup_budget_ms = float(os.getenv('STARTUP_BUDGET_MS', '500'))
@@ -1,85 +1,418 @@
 import os
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import DeleteMany, InsertOne, MongoClient, ReturnDocument, UpdateOne, ReplaceOne, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 import logging
-from dotenv import load_dotenv
 from database.config import Config
+from database.write_buffer import SurveyWriteBuffer
+from utils.metrics import MONGODB_OPERATION_SECONDS, MONGODB_RECONNECTS
+from utils.questions import normalize_question, question_id, response_question_id
+
+SENTIMENT_KEYS = ('positive', 'negative', 'neutral', 'pending')
+
+# Time bucket sizes maintained on write, with the length of their ISO prefix
+BUCKET_GRANULARITIES = {'hour': 13, 'day': 10}
+
+# Catalog texts kept in memory per process before the cache is reset
+QUESTION_TEXT_CACHE_SIZE = 50000
+
+# Best matches a text search ranks and pages through; further matches are never returned
+SEARCH_MAX_HITS = 1000
+
+# Seconds a worker trusts "counters built, no rebuild running" before re-reading it
+ROLLUP_STATE_TTL = 1.0
+# Longest a rebuild may pause writers while it swaps its counters in
+ROLLUP_SWAP_SECONDS = 60
+# Lease of a running rebuild, renewed while it streams the surveys
+ROLLUP_REBUILD_LEASE_SECONDS = 300
+# Seconds between attempts of a worker to build counters that never were
+ROLLUP_SEED_RETRY_SECONDS = 60
+
+# Survey fields the rollup counters are computed from
+ROLLUP_PROJECTION = {
+    "_id": 0,
+    "surveyId": 1,
+    "completedAt": 1,
+    "responses.questionId": 1,
+    "responses.question": 1,
+    "responses.SentiAnalysis.label": 1
+}
+
+
+def sentiment_key(response):
+    """Map a response's SentiAnalysis label to its rollup counter name"""
+    label = (response.get('SentiAnalysis') or {}).get('label', 'NEUTRAL')
+    if label == 'POSITIVE':
+        return 'positive'
+    if label == 'NEGATIVE':
+        return 'negative'
+    if label == 'PENDING':
+        return 'pending'
+    return 'neutral'  # NEUTRAL or any other value
+
+
+def empty_rollup():
+    """Fresh (totals, per-question) counters for accumulate_rollup"""
+    return dict.fromkeys(('surveys', 'answers') + SENTIMENT_KEYS, 0), {}
+
+
+def accumulate_rollup(totals, questions, survey, sign=1):
+    """Add (sign=1) or subtract (sign=-1) a survey's sentiment counts"""
+    if not survey:
+        return
+    totals['surveys'] += sign
+    for response in survey.get('responses', []):
+        key = sentiment_key(response)
+        counts = questions.setdefault(
+            response_question_id(response),
+            dict.fromkeys(SENTIMENT_KEYS + ('total',), 0)
+        )
+        counts[key] += sign
+        counts['total'] += sign
+        totals[key] += sign
+        totals['answers'] += sign
+
+
+def compact_counted(survey):
+    """What a survey adds to the counters, small enough to keep for every survey"""
+    return (survey.get('completedAt'), tuple(
+        (response_question_id(response), (response.get('SentiAnalysis') or {}).get('label'))
+        for response in survey.get('responses') or []
+    ))
+
+
+def expand_counted(counted):
+    """Survey-shaped copy of a compact_counted() value, for accumulate_rollup"""
+    completed_at, responses = counted
+    return {'completedAt': completed_at, 'responses': [
+        {'questionId': qid, 'SentiAnalysis': {'label': label}} for qid, label in responses
+    ]}
+
+
+def timed_operation(method):
+    """Record a MongoDBManager method's latency in MONGODB_OPERATION_SECONDS"""
+    return MONGODB_OPERATION_SECONDS.labels(operation=method.__name__.lstrip('_')).time()(method)
+
+
+def parse_timestamp(value):
+    """UTC datetime of an ISO 8601 string or datetime; None if it cannot be parsed"""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def bucket_key(value, granularity):
+    """Start of the hour/day bucket containing a timestamp, e.g. '2024-05-01T13' or '2024-05-01'"""
+    timestamp = parse_timestamp(value)
+    if timestamp is None:
+        return None
+    return timestamp.strftime('%Y-%m-%dT%H')[:BUCKET_GRANULARITIES[granularity]]
+
+
+def accumulate_buckets(buckets, survey, sign=1):
+    """Add or subtract a survey's counts in every time bucket its completedAt falls in"""
+    if not survey:
+        return
+    for granularity in BUCKET_GRANULARITIES:
+        key = bucket_key(survey.get('completedAt'), granularity)
+        if key is None:
+            continue
+        if (granularity, key) not in buckets:
+            buckets[(granularity, key)] = empty_rollup()
+        accumulate_rollup(*buckets[(granularity, key)], survey, sign)
+
+
+def completed_at_query(start=None, end=None):
+    """Filter on completedAt for an optional [start, end) range of ISO 8601 dates
+
+    Raises ValueError for malformed or empty ranges.
+    """
+    bounds = {}
+    for name, value, operator in (("from", start, "$gte"), ("to", end, "$lt")):
+        if not value:
+            continue
+        timestamp = parse_timestamp(value)
+        if timestamp is None:
+            raise ValueError(f"{name} must be an ISO 8601 date")
+        # completedAt is stored as an ISO string ("...T12:00:00.000Z"); a prefix
+        # without fractions or zone sorts before every value within that second
+        bounds[operator] = timestamp.strftime("%Y-%m-%dT%H:%M:%S")
+    if "$gte" in bounds and "$lt" in bounds and bounds["$gte"] >= bounds["$lt"]:
+        raise ValueError("from must be before to")
+    return {"completedAt": bounds} if bounds else {}
+
+
+def answer_documents(survey):
+    """Search index entries (one per non-empty answer) of a survey"""
+    for index, response in enumerate(survey.get("responses") or []):
+        answer = response.get("answer")
+        if not isinstance(answer, str) or not answer.strip():
+            continue
+        yield {
+            "_id": f"{survey['surveyId']}:{index}",
+            "surveyId": survey["surveyId"],
+            "index": index,
+            "questionId": response_question_id(response),
+            "answer": answer,
+            "label": (response.get("SentiAnalysis") or {}).get("label"),
+            "completedAt": survey.get("completedAt")
+        }
+
+
+def keyset_query(after):
+    """Filter for surveys that sort after a (completedAt, surveyId) position, newest first"""
+    if after is None:
+        return {}
+    completed_at, survey_id = after
+    return {"$or": [
+        {"completedAt": {"$lt": completed_at}},
+        {"completedAt": completed_at, "surveyId": {"$lt": survey_id}}
+    ]}
+
+
+class ServerHealthMonitor(monitoring.ServerHeartbeatListener):
+    """Tracks server reachability from pymongo's own background heartbeats"""
+    
+    def __init__(self):
+        self.servers = {}
+        self.recoveries = 0
+    
+    def started(self, event):
+        pass
+    
+    def succeeded(self, event):
+        if self.servers.get(event.connection_id) is False:
+            self.recoveries += 1
+            MONGODB_RECONNECTS.labels(kind='heartbeat').inc()
+            logging.info(f"MongoDB server {event.connection_id} is reachable again")
+        self.servers[event.connection_id] = True
+    
+    def failed(self, event):
+        if self.servers.get(event.connection_id) is not False:
+            logging.error(f"MongoDB server {event.connection_id} heartbeat failed: {event.reply}")
+        self.servers[event.connection_id] = False
+    
+    @property
+    def healthy(self):
+        # Optimistic until the first heartbeat has completed
+        return not self.servers or any(self.servers.values())
 
-# Load environment variables
-load_dotenv()
 
 class MongoDBManager:
+    """Per-process MongoDB access; the client is created lazily on first use
+    
+    Nothing touches the network at import time, and a process forked from
+    the one that created the client (gunicorn --preload) builds its own.
+    Indexes are created by `flask init-db` (ensure_indexes), not at startup.
+    """
+    
     def __init__(self):
         self.client = None
         self.db = None
         self.surveys_collection = None
-        self._connect()
+        self.rollups_collection = None
+        self.buckets_collection = None
+        self.sentiment_cache_collection = None
+        self.sentiment_jobs_collection = None
+        self.question_pool_collection = None
+        self.question_catalog_collection = None
+        self.locks_collection = None
+        self.checkpoints_collection = None
+        self.response_cache_collection = None
+        self.analytics_events_collection = None
+        self.live_dashboards_collection = None
+        self.answers_collection = None
+        # Catalog entries never change, so their texts are cached for the process lifetime
+        self._question_texts = {}
+        # Called with every counter delta written by _update_rollups (see server/live_updates.py)
+        self.rollup_listeners = []
+        # When this process last saw the counters built with no rebuild running
+        self._rollups_ready_at = None
+        # Background build of counters that never were (see _rollup_state)
+        self._seed_thread = None
+        self._seed_started_at = None
+        # Per-process SurveyWriteBuffer behind buffer_survey(), created on first use
+        self._write_buffer = None
+        self._write_buffer_lock = threading.Lock()
+        self.monitor = ServerHealthMonitor()
+        self._data_version = None
+        self.reconnects = 0
+        self._pid = None
+        self._connect_lock = threading.Lock()
+        self._reconnect_lock = threading.Lock()
+        self._reconnect_thread = None
+        os.register_at_fork(after_in_child=self.reset_after_fork)
+    
+    def reset_after_fork(self):
+        """Forget state inherited from the parent process; reconnects on next use"""
+        # The parent's client is not closed here: its sockets are shared with the parent
+        self.client = None
+        self.db = None
+        self._pid = None
+        self._data_version = None
+        self._connect_lock = threading.Lock()
+        self._reconnect_lock = threading.Lock()
+        self._reconnect_thread = None
+        # The flusher thread does not survive the fork; queued surveys belong to the parent
+        self._write_buffer = None
+        self._write_buffer_lock = threading.Lock()
+        self._rollups_ready_at = None
+        self._seed_thread = None
+        self._seed_started_at = None
     
-    def _connect(self):
+    def _connect(self, retry_in_background=True):
         """Establish connection to MongoDB"""
+        mongo_uri = Config.mongo_uri
+        db_name = Config.db_name
+        self._pid = os.getpid()
+        
         try:
-            
-            mongo_uri = Config.mongo_uri
-            db_name = Config.db_name
-            
-            # Create MongoDB client
+            # Create MongoDB client; this does no network I/O. pymongo monitors
+            # the servers in the background and re-establishes pooled
+            # connections on its own from here on
+            self.monitor = ServerHealthMonitor()
             self.client = MongoClient(
                 mongo_uri,
-                serverSelectionTimeoutMS=5000,  # 5 second timeout
-                connectTimeoutMS=10000,  # 10 second connection timeout
-                socketTimeoutMS=20000,  # 20 second socket timeout
+                maxPoolSize=Config.mongo_max_pool_size,
+                minPoolSize=Config.mongo_min_pool_size,
+                serverSelectionTimeoutMS=Config.mongo_server_selection_timeout_ms,
+                connectTimeoutMS=Config.mongo_connect_timeout_ms,
+                socketTimeoutMS=Config.mongo_socket_timeout_ms,
+                heartbeatFrequencyMS=Config.mongo_heartbeat_frequency_ms,
+                event_listeners=[self.monitor],
             )
-            
-            # Test the connection
-            self.client.admin.command('ping')
-            
-            # Get database and collection
-            self.db = self.client[db_name]
-            self.surveys_collection = self.db.surveys
-            
-            # Create indexes for better performance
-            self.surveys_collection.create_index("surveyId", unique=True)
-            self.surveys_collection.create_index("completedAt")
-            
-            logging.info(f"Successfully connected to MongoDB database: {db_name}")
-            
-        except (ConnectionFailure, ServerSelectionTimeoutError) as e:
-            logging.error(f"Failed to connect to MongoDB: {e}")
+        except Exception as e:
+            # Invalid URI, unresolvable mongodb+srv host, ...
+            logging.error(f"Failed to create MongoDB client: {e}")
             self.client = None
-            self.db = None
-            self.surveys_collection = None
+            if retry_in_background:
+                self._schedule_reconnect()
+            return
+        
+        # Get database and collection
+        self.db = self.client[db_name]
+        self.surveys_collection = self.db.surveys
+        self.rollups_collection = self.db.analytics_rollups
+        self.buckets_collection = self.db.analytics_buckets
+        self.sentiment_cache_collection = self.db.sentiment_cache
+        self.sentiment_jobs_collection = self.db.sentiment_jobs
+        self.question_pool_collection = self.db.question_pool
+        self.question_catalog_collection = self.db.question_catalog
+        self.locks_collection = self.db.locks
+        self.checkpoints_collection = self.db.checkpoints
+        self.response_cache_collection = self.db.response_cache
+        self.analytics_events_collection = self.db.analytics_events
+        self.live_dashboards_collection = self.db.live_dashboards
+        self.answers_collection = self.db.survey_answers
+        
+        logging.info(f"MongoDB client created for database: {db_name} (pid {self._pid})")
+    
+    def ensure_indexes(self):
+        """Create every index the application relies on (idempotent)"""
+        self._ensure_connection()
+        
+        self.surveys_collection.create_index("surveyId", unique=True)
+        self.surveys_collection.create_index("completedAt")
+        self.surveys_collection.create_index([("completedAt", -1), ("surveyId", -1)])
+        self.surveys_collection.create_index([("responses.questionId", 1), ("responses.SentiAnalysis.label", 1)])
+        self.rollups_collection.create_index([("scope", 1), ("total", -1)])
+        self.buckets_collection.create_index([("granularity", 1), ("start", 1)])
+        self.sentiment_cache_collection.create_index(
+            "createdAt",
+            expireAfterSeconds=Config.sentiment_cache_ttl
+        )
+        self.sentiment_jobs_collection.create_index([("status", 1), ("availableAt", 1)])
+        self.question_pool_collection.create_index("key", unique=True)
+        self.question_pool_collection.create_index([("servedCount", 1), ("lastServedAt", 1)])
+        # Cached responses for rarely repeated queries (e.g. odd date ranges) expire
+        self.response_cache_collection.create_index("updatedAt", expireAfterSeconds=24 * 3600)
+        # Answer search (one document per answer, see answer_documents)
+        self.answers_collection.create_index([("answer", "text")], name="answer_text", default_language="english")
+        self.answers_collection.create_index("surveyId")
+        # Live dashboard deltas are only needed until every worker has relayed them
+        self.analytics_events_collection.create_index("createdAt", expireAfterSeconds=3600)
+        self.live_dashboards_collection.create_index("expiresAt", expireAfterSeconds=0)
+    
+    def _schedule_reconnect(self):
+        """Retry creating the client in the background with exponential backoff"""
+        with self._reconnect_lock:
+            if self._reconnect_thread is not None and self._reconnect_thread.is_alive():
+                return
+            self._reconnect_thread = threading.Thread(
+                target=self._reconnect_loop, name="mongodb-reconnect", daemon=True
+            )
+            self._reconnect_thread.start()
+    
+    def _reconnect_loop(self):
+        delay = Config.mongo_reconnect_initial_delay
+        while self.client is None:
+            time.sleep(delay)
+            self.reconnects += 1
+            MONGODB_RECONNECTS.labels(kind='client').inc()
+            logging.info(f"Reconnecting to MongoDB (attempt {self.reconnects})")
+            with self._connect_lock:
+                self._connect(retry_in_background=False)
+            delay = min(delay * 2, Config.mongo_reconnect_max_delay)
+    
+    def _ensure_connection(self):
+        """Connect on first use in this process, then fail fast while MongoDB is unreachable
+        
+        No network round trip is made here; health comes from pymongo's heartbeats.
+        """
+        if self._pid != os.getpid():
+            with self._connect_lock:
+                if self._pid != os.getpid():
+                    self._connect()
+        if self.client is None:
+            self._schedule_reconnect()
+            raise Exception("MongoDB connection not available")
+        if not self.monitor.healthy:
+            raise Exception("MongoDB connection not available")
     
     def is_connected(self):
-        """Check if MongoDB connection is active"""
+        """Check if MongoDB connection is active (from the latest server heartbeats)"""
         try:
-            if self.client:
-                self.client.admin.command('ping')
-                return True
+            self._ensure_connection()
         except Exception:
-            pass
-        return False
+            return False
+        return True
     
+    @timed_operation
     def save_survey(self, survey_data):
         """Save survey data to MongoDB"""
         try:
-            if not self.is_connected():
-                self._connect()
-            
-            if self.surveys_collection is None:
-                raise Exception("MongoDB connection not available")
+            self._ensure_connection()
+            self._catalog_responses([survey_data])
+            state = self._rollup_state()
             
-            # Use upsert to avoid duplicate entries
-            result = self.surveys_collection.replace_one(
+            # Use upsert to avoid duplicate entries; the previous version (if any)
+            # is returned so its contribution can be taken out of the rollups
+            previous = self.surveys_collection.find_one_and_replace(
                 {"surveyId": survey_data["surveyId"]},
                 survey_data,
-                upsert=True
+                projection={"_id": 0, "completedAt": 1, "responses": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
             )
             
+            self._update_rollups(state, added=survey_data, removed=previous, survey_ids=[survey_data["surveyId"]])
+            self._index_answers([survey_data], replaced=[survey_data["surveyId"]] if previous else ())
+            
             return {
                 "success": True,
                 "surveyId": survey_data["surveyId"],
-                "upserted": result.upserted_id is not None,
-                "modified": result.modified_count > 0
+                "upserted": previous is None,
+                "modified": previous is not None
             }
             
         except Exception as e:
@@ -89,20 +422,43 @@ class MongoDBManager:
                 "error": str(e)
             }
     
+    def buffer_survey(self, survey_data, pending_items=None):
+        """Save a survey, and queue its PENDING answers, as part of a coalesced bulk write
+        
+        Blocks until the write buffer has flushed it. Returns the save_survey()
+        keys, plus `busy` if the buffer was full.
+        """
+        if self._write_buffer is None:
+            with self._write_buffer_lock:
+                if self._write_buffer is None:
+                    self._write_buffer = SurveyWriteBuffer(
+                        self,
+                        max_batch_size=Config.survey_write_buffer_batch_size,
+                        flush_interval_ms=Config.survey_write_buffer_interval_ms,
+                        max_pending=Config.survey_write_buffer_max_pending,
+                        timeout=Config.survey_write_buffer_timeout
+                    )
+        return self._write_buffer.submit(survey_data, pending_items)
+    
+    def flush_write_buffer(self, timeout=None):
+        """Write out buffered surveys and stop the buffer (on shutdown); later saves start a new one"""
+        with self._write_buffer_lock:
+            write_buffer, self._write_buffer = self._write_buffer, None
+        if write_buffer is not None:
+            write_buffer.close(timeout)
+    
+    @timed_operation
     def get_all_surveys(self):
         """Retrieve all surveys from MongoDB"""
         try:
-            if not self.is_connected():
-                self._connect()
-            
-            if self.surveys_collection is None:
-                raise Exception("MongoDB connection not available")
+            self._ensure_connection()
             
             # Get all surveys, sorted by completion date (newest first)
             surveys = list(self.surveys_collection.find(
                 {},
                 {"_id": 0}  # Exclude MongoDB's _id field
             ).sort("completedAt", -1))
+            self._hydrate_questions(surveys)
             
             return {
                 "success": True,
@@ -118,19 +474,188 @@ class MongoDBManager:
                 "error": str(e)
             }
     
+    @timed_operation
+    def save_surveys(self, surveys, chunk_size=1000):
+        """Upsert many surveys chunk by chunk
+        
+        New surveys are inserted with an unordered bulk write; stored ones are
+        replaced one at a time, so the rollups subtract exactly the version
+        each save replaced. Returns per-record errors (by position in
+        `surveys`) instead of failing the whole batch; rollups are updated
+        once per chunk.
+        """
+        saved = 0
+        upserted = 0
+        duplicates = 0
+        errors = []
+        
+        for start in range(0, len(surveys), chunk_size):
+            chunk = list(enumerate(surveys[start:start + chunk_size], start))
+            
+            # Validate; a surveyId repeated within the chunk keeps its last version
+            latest = {}
+            for index, survey in chunk:
+                survey_id = survey.get("surveyId") if isinstance(survey, dict) else None
+                if not survey_id:
+                    errors.append({"index": index, "surveyId": None, "error": "Missing surveyId"})
+                    continue
+                if survey_id in latest:
+                    duplicates += 1
+                latest[survey_id] = (index, survey)
+            
+            if not latest:
+                continue
+            
+            try:
+                self._ensure_connection()
+                self._catalog_responses([survey for _, survey in latest.values()])
+                state = self._rollup_state()
+                
+                # Surveys not stored yet are inserted in one bulk write; one that
+                # appears meanwhile is left alone and replaced below instead
+                existing = {
+                    doc["surveyId"]
+                    for doc in self.surveys_collection.find(
+                        {"surveyId": {"$in": list(latest)}}, {"_id": 0, "surveyId": 1}
+                    )
+                }
+                inserts = [record for record in latest.values() if record[1]["surveyId"] not in existing]
+                replaces = [record for record in latest.values() if record[1]["surveyId"] in existing]
+                written = []
+                previous = {}
+                if inserts:
+                    failed = {}
+                    try:
+                        result = self.surveys_collection.bulk_write([
+                            UpdateOne({"surveyId": survey["surveyId"]}, {"$setOnInsert": survey}, upsert=True)
+                            for _, survey in inserts
+                        ], ordered=False)
+                        inserted = result.upserted_ids
+                    except BulkWriteError as e:
+                        for write_error in e.details.get("writeErrors", []):
+                            failed[write_error["index"]] = write_error.get("errmsg", "Write failed")
+                        inserted = {upsert["index"]: upsert["_id"] for upsert in e.details.get("upserted", [])}
+                    for position, (index, survey) in enumerate(inserts):
+                        if position in failed:
+                            errors.append({"index": index, "surveyId": survey["surveyId"], "error": failed[position]})
+                        elif position in inserted:
+                            written.append(survey)
+                            upserted += 1
+                        else:
+                            replaces.append((index, survey))
+                
+                # Replacements one by one, each returning the exact version it
+                # replaced so concurrent resubmits are not double counted
+                for index, survey in replaces:
+                    try:
+                        before = self.surveys_collection.find_one_and_replace(
+                            {"surveyId": survey["surveyId"]},
+                            survey,
+                            projection={"_id": 0, "completedAt": 1, "responses": 1},
+                            upsert=True,
+                            return_document=ReturnDocument.BEFORE
+                        )
+                    except Exception as e:
+                        errors.append({"index": index, "surveyId": survey["surveyId"], "error": str(e)})
+                        continue
+                    written.append(survey)
+                    if before is None:
+                        upserted += 1
+                    else:
+                        previous[survey["surveyId"]] = before
+                
+                self._update_rollups(
+                    state,
+                    added=written,
+                    removed=[previous[s["surveyId"]] for s in written if s["surveyId"] in previous],
+                    survey_ids=[s["surveyId"] for s in written]
+                )
+                self._index_answers(written, replaced=[s["surveyId"] for s in written if s["surveyId"] in previous])
+                saved += len(written)
+                
+            except Exception as e:
+                logging.error(f"Error bulk saving surveys to MongoDB: {e}")
+                errors.extend(
+                    {"index": index, "surveyId": survey["surveyId"], "error": str(e)}
+                    for index, survey in latest.values()
+                )
+        
+        return {
+            "success": not errors,
+            "saved": saved,
+            "upserted": upserted,
+            "duplicates": duplicates,
+            "errors": sorted(errors, key=lambda error: error["index"])
+        }
+    
+    @timed_operation
+    def get_surveys_page(self, limit=20, after=None):
+        """Retrieve one page of surveys (newest first) using keyset pagination
+        
+        `after` is the (completedAt, surveyId) pair of the last survey on the
+        previous page; the returned `next` pair is None on the final page.
+        """
+        try:
+            self._ensure_connection()
+            
+            # Fetch one extra document to know whether another page exists
+            surveys = list(self.surveys_collection.find(
+                keyset_query(after),
+                {"_id": 0}
+            ).sort([("completedAt", -1), ("surveyId", -1)]).limit(limit + 1))
+            
+            next_key = None
+            if len(surveys) > limit:
+                surveys = surveys[:limit]
+                next_key = (surveys[-1].get("completedAt"), surveys[-1].get("surveyId"))
+            self._hydrate_questions(surveys)
+            
+            return {
+                "success": True,
+                "surveys": surveys,
+                "next": next_key
+            }
+            
+        except Exception as e:
+            logging.error(f"Error retrieving surveys page from MongoDB: {e}")
+            return {
+                "success": False,
+                "surveys": [],
+                "error": str(e)
+            }
+    
+    def iter_surveys(self, query=None, after=None, batch_size=500, projection=None):
+        """Stream surveys (newest first) from a server-side cursor
+        
+        Only `batch_size` documents are held in memory at a time. Errors are
+        raised to the caller since results may already have been consumed.
+        """
+        query = {"$and": [query or {}, keyset_query(after)]}
+        self._ensure_connection()
+        
+        cursor = self.surveys_collection.find(
+            query,
+            {"_id": 0, **(projection or {})},
+            batch_size=batch_size
+        ).sort([("completedAt", -1), ("surveyId", -1)])
+        
+        with cursor:
+            for survey in cursor:
+                self._hydrate_questions([survey])
+                yield survey
+    
+    @timed_operation
     def get_survey_by_id(self, survey_id):
         """Retrieve a specific survey by ID"""
         try:
-            if not self.is_connected():
-                self._connect()
-            
-            if self.surveys_collection is None:
-                raise Exception("MongoDB connection not available")
+            self._ensure_connection()
             
             survey = self.surveys_collection.find_one(
                 {"surveyId": survey_id},
                 {"_id": 0}
             )
+            if survey:
+                self._hydrate_questions([survey])
             
             return {
                 "success": True,
@@ -145,35 +670,38 @@ class MongoDBManager:
                 "error": str(e)
             }
     
+    @timed_operation
     def get_surveys_count(self):
         """Get total count of surveys"""
         try:
-            if not self.is_connected():
-                self._connect()
+            self._ensure_connection()
             
-            if self.surveys_collection is None:
-                return 0
-            
-            return self.surveys_collection.count_documents({})
+            # Collection metadata instead of a full count_documents scan
+            return self.surveys_collection.estimated_document_count()
             
         except Exception as e:
             logging.error(f"Error getting surveys count from MongoDB: {e}")
             return 0
     
+    @timed_operation
     def delete_survey(self, survey_id):
         """Delete a survey by ID"""
         try:
-            if not self.is_connected():
-                self._connect()
+            self._ensure_connection()
+            state = self._rollup_state()
             
-            if self.surveys_collection is None:
-                raise Exception("MongoDB connection not available")
+            deleted = self.surveys_collection.find_one_and_delete(
+                {"surveyId": survey_id},
+                projection={"_id": 0, "completedAt": 1, "responses": 1}
+            )
             
-            result = self.surveys_collection.delete_one({"surveyId": survey_id})
+            if deleted is not None:
+                self._update_rollups(state, removed=deleted, survey_ids=[survey_id])
+                self._index_answers([], removed=[survey_id])
             
             return {
                 "success": True,
-                "deleted": result.deleted_count > 0
+                "deleted": deleted is not None
             }
             
         except Exception as e:
@@ -183,13 +711,1248 @@ class MongoDBManager:
                 "error": str(e)
             }
     
+    @timed_operation
+    def _update_rollups(self, state, added=None, removed=None, survey_ids=()):
+        """Apply the difference between two survey versions to the rollup counters
+        
+        `added` / `removed` are single surveys or lists of surveys. Both the
+        all-time counters and the hourly/daily buckets are updated. `state` is
+        what _rollup_state() returned before the surveys were written: counters
+        that were never built are left alone, and while a rebuild is scanning
+        the changed `survey_ids` are noted for it.
+        """
+        built, scanning = state
+        totals, questions = empty_rollup()
+        buckets = {}
+        for survey in (added if isinstance(added, list) else [added]):
+            accumulate_rollup(totals, questions, survey, 1)
+            accumulate_buckets(buckets, survey, 1)
+        for survey in (removed if isinstance(removed, list) else [removed]):
+            accumulate_rollup(totals, questions, survey, -1)
+            accumulate_buckets(buckets, survey, -1)
+        
+        operations = [
+            UpdateOne({"_id": f"touched:{survey_id}"}, {"$setOnInsert": {"scope": "touched"}}, upsert=True)
+            for survey_id in (survey_ids if scanning else ())
+        ]
+        totals = {key: value for key, value in totals.items() if value}
+        if totals and built:
+            operations.append(UpdateOne(
+                {"_id": "totals"},
+                {"$inc": totals, "$setOnInsert": {"scope": "totals"}},
+                upsert=True
+            ))
+        for qid, delta in questions.items():
+            delta = {key: value for key, value in delta.items() if value}
+            if delta and built:
+                operations.append(UpdateOne(
+                    {"_id": f"question:{qid}"},
+                    {"$inc": delta, "$setOnInsert": {"scope": "question", "questionId": qid}},
+                    upsert=True
+                ))
+        
+        bucket_operations = []
+        for (granularity, start), (bucket_totals, bucket_questions) in buckets.items():
+            increments = {key: value for key, value in bucket_totals.items() if value}
+            for qid, delta in bucket_questions.items():
+                for key, value in delta.items():
+                    if value:
+                        increments[f"questions.{qid}.{key}"] = value
+            if increments and built:
+                bucket_operations.append(UpdateOne(
+                    {"_id": f"{granularity}:{start}"},
+                    {
+                        "$inc": increments,
+                        "$setOnInsert": {"granularity": granularity, "start": start}
+                    },
+                    upsert=True
+                ))
+        
+        if not totals and not operations and not bucket_operations:
+            return
+        try:
+            if operations:
+                self.rollups_collection.bulk_write(operations, ordered=False)
+            if bucket_operations:
+                self.buckets_collection.bulk_write(bucket_operations, ordered=False)
+        except Exception as e:
+            # The survey itself is already stored; the rollups can be repaired
+            # with `flask rebuild-rollups`
+            logging.error(f"Error updating analytics rollups: {e}")
+        version = self.bump_data_version()
+        
+        if version is not None and self.rollup_listeners:
+            delta = {
+                "version": version,
+                "totals": totals,
+                "questions": {
+                    qid: {key: value for key, value in counts.items() if value}
+                    for qid, counts in questions.items()
+                    if any(counts.values())
+                }
+            }
+            for listener in self.rollup_listeners:
+                try:
+                    listener(delta)
+                except Exception as e:
+                    logging.error(f"Error publishing analytics delta: {e}")
+    
+    def _rollup_state(self):
+        """(built, scanning) state of the rollup counters, read before writing surveys
+        
+        `built` is False until the counters have first been computed from the
+        surveys (this worker then starts doing that in the background);
+        `scanning` while a rebuild streams the surveys. Blocks while a rebuild
+        swaps its counters in, at most ROLLUP_SWAP_SECONDS.
+        """
+        ready_at = self._rollups_ready_at
+        if ready_at is not None and time.monotonic() - ready_at < ROLLUP_STATE_TTL:
+            return True, False
+        
+        self._ensure_connection()
+        deadline = time.monotonic() + ROLLUP_SWAP_SECONDS
+        while True:
+            doc = self.rollups_collection.find_one({"_id": "state"}) or {}
+            until = parse_timestamp(doc.get("until"))
+            # A rebuild whose lease ran out has died
+            phase = doc.get("phase") if until and until > datetime.now(timezone.utc) else None
+            if phase != "swap" or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        
+        built = bool(doc.get("built"))
+        if phase is None:
+            if built:
+                self._rollups_ready_at = time.monotonic()
+            else:
+                self._seed_rollups_in_background()
+        return built, phase is not None
+    
+    def _seed_rollups_in_background(self):
+        started_at = self._seed_started_at
+        if started_at is not None and time.monotonic() - started_at < ROLLUP_SEED_RETRY_SECONDS:
+            return
+        self._seed_started_at = time.monotonic()
+        self._seed_thread = threading.Thread(target=self.seed_rollups, name="rollup-seed", daemon=True)
+        self._seed_thread.start()
+    
+    def seed_rollups(self):
+        """Build the rollup counters if they never have been; returns the rebuild result or None"""
+        self._ensure_connection()
+        doc = self.rollups_collection.find_one({"_id": "state"}, {"built": 1})
+        if doc and doc.get("built"):
+            return None
+        return self.rebuild_rollups()
+    
+    def _begin_rebuild(self):
+        """Mark a rebuild as scanning; returns its token, or None if another one is running"""
+        now = datetime.now(timezone.utc)
+        token = uuid.uuid4().hex
+        try:
+            self.rollups_collection.update_one(
+                {"_id": "state", "$or": [{"until": {"$exists": False}}, {"until": {"$lt": now}}]},
+                {"$set": {
+                    "scope": "state",
+                    "phase": "scan",
+                    "token": token,
+                    "until": now + timedelta(seconds=ROLLUP_REBUILD_LEASE_SECONDS)
+                }},
+                upsert=True
+            )
+            return token
+        except DuplicateKeyError:
+            return None
+    
+    def _set_rebuild_phase(self, token, phase, seconds):
+        """Move a running rebuild to `phase` and extend its lease; False if it lost the lease"""
+        result = self.rollups_collection.update_one(
+            {"_id": "state", "token": token},
+            {"$set": {"phase": phase, "until": datetime.now(timezone.utc) + timedelta(seconds=seconds)}}
+        )
+        return result.matched_count == 1
+    
+    def _end_rebuild(self, token, built):
+        update = {"$unset": {"phase": "", "token": "", "until": ""}}
+        if built:
+            update["$set"] = {"built": True}
+        self.rollups_collection.update_one({"_id": "state", "token": token}, update)
+    
+    @timed_operation
+    def bump_data_version(self):
+        """Advance the survey data version, invalidating cached analytics responses"""
+        try:
+            doc = self.rollups_collection.find_one_and_update(
+                {"_id": "version"},
+                {"$inc": {"version": 1}, "$setOnInsert": {"scope": "version"}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            self._data_version = (doc["version"], time.monotonic())
+            return doc["version"]
+        except Exception as e:
+            # Other workers keep serving their cached analytics until the next successful bump
+            self._data_version = None
+            logging.error(f"Error bumping survey data version: {e}")
+            return None
+    
+    def get_data_version(self, max_age=0):
+        """Current survey data version, reusing this process's copy for up to `max_age` seconds"""
+        cached = self._data_version
+        if cached is not None and time.monotonic() - cached[1] < max_age:
+            return cached[0]
+        
+        self._ensure_connection()
+        doc = self.rollups_collection.find_one({"_id": "version"}, {"version": 1})
+        version = doc["version"] if doc else 0
+        self._data_version = (version, time.monotonic())
+        return version
+    
+    def add_analytics_event(self, event):
+        """Record a live dashboard delta for the other workers' change streams"""
+        self._ensure_connection()
+        self.analytics_events_collection.insert_one({**event, "createdAt": datetime.now(timezone.utc)})
+    
+    def supports_change_streams(self):
+        """Whether the server is a replica set or sharded cluster, which watch_analytics_events needs"""
+        self._ensure_connection()
+        try:
+            hello = self.client.admin.command("hello")
+        except NotImplementedError:
+            # In-memory stand-in used by the benchmarks
+            return False
+        return "setName" in hello or hello.get("msg") == "isdbgrid"
+    
+    def announce_live_dashboards(self, origin, seconds):
+        """Record that worker `origin` has dashboards connected, for the next `seconds`"""
+        self._ensure_connection()
+        self.live_dashboards_collection.update_one(
+            {"_id": origin},
+            {"$set": {"expiresAt": datetime.now(timezone.utc) + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+    
+    def withdraw_live_dashboards(self, origin):
+        """Record that worker `origin` has no dashboards connected any more"""
+        self._ensure_connection()
+        self.live_dashboards_collection.delete_one({"_id": origin})
+    
+    def live_dashboards_elsewhere(self, origin):
+        """Whether a worker other than `origin` has announced connected dashboards"""
+        self._ensure_connection()
+        return self.live_dashboards_collection.find_one({
+            "_id": {"$ne": origin},
+            "expiresAt": {"$gt": datetime.now(timezone.utc)}
+        }, {"_id": 1}) is not None
+    
+    def watch_analytics_events(self):
+        """Yield analytics events inserted from now on, as they arrive
+        
+        Needs a replica set or sharded cluster: a standalone server raises
+        OperationFailure (change streams unsupported).
+        """
+        self._ensure_connection()
+        with self.analytics_events_collection.watch([{"$match": {"operationType": "insert"}}]) as stream:
+            for change in stream:
+                yield change["fullDocument"]
+    
+    @timed_operation
+    def get_cached_response(self, name, version):
+        """Rendered response body cached for `name` at data `version`, or None"""
+        self._ensure_connection()
+        doc = self.response_cache_collection.find_one({"_id": name, "version": version})
+        return doc["body"] if doc else None
+    
+    @timed_operation
+    def cache_response(self, name, version, body):
+        """Share a rendered response body with the other workers"""
+        self._ensure_connection()
+        # Never overwrite a newer version rendered by another worker
+        try:
+            self.response_cache_collection.update_one(
+                {"_id": name, "version": {"$lt": version}},
+                {"$set": {"version": version, "body": body, "updatedAt": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            pass
+    
+    @timed_operation
+    def get_analytics_rollups(self):
+        """Retrieve the pre-aggregated sentiment counters used by the analytics dashboard"""
+        try:
+            self._ensure_connection()
+            
+            built, _ = self._rollup_state()
+            if not built:
+                # Rollups have never been built; answer from the surveys themselves
+                return self.aggregate_question_sentiment()
+            totals_doc = self.rollups_collection.find_one({"_id": "totals"}) or {}
+            
+            totals = {key: totals_doc.get(key, 0) for key in ('surveys', 'answers') + SENTIMENT_KEYS}
+            counters = {
+                doc["questionId"]: {key: doc.get(key, 0) for key in SENTIMENT_KEYS + ('total',)}
+                for doc in self.rollups_collection.find({"scope": "question"}, {"_id": 0})
+            }
+            
+            return {
+                "success": True,
+                "source": "rollups",
+                "totals": totals,
+                "questions": self._question_counts(counters, {})
+            }
+            
+        except Exception as e:
+            logging.error(f"Error retrieving analytics rollups from MongoDB: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    @timed_operation
+    def aggregate_question_sentiment(self):
+        """Group response sentiment by question server-side, most answered questions first"""
+        try:
+            self._ensure_connection()
+            
+            # Responses saved before the question catalog carry their text
+            # instead of a questionId; those are mapped to IDs below
+            pipeline = [
+                {"$project": {
+                    "_id": 0,
+                    "responses.questionId": 1,
+                    "responses.question": 1,
+                    "responses.SentiAnalysis.label": 1
+                }},
+                {"$unwind": "$responses"},
+                {"$group": {
+                    "_id": {
+                        "questionId": "$responses.questionId",
+                        "question": {"$cond": [
+                            {"$ifNull": ["$responses.questionId", False]},
+                            None,
+                            {"$ifNull": ["$responses.question", "Unknown"]}
+                        ]},
+                        "label": "$responses.SentiAnalysis.label"
+                    },
+                    "count": {"$sum": 1}
+                }}
+            ]
+            
+            totals = dict.fromkeys(('surveys', 'answers') + SENTIMENT_KEYS, 0)
+            counters = {}
+            legacy_texts = {}
+            for doc in self.surveys_collection.aggregate(pipeline, allowDiskUse=True):
+                group = doc["_id"]
+                qid = group.get("questionId") or question_id(group["question"])
+                if group.get("question"):
+                    legacy_texts[qid] = group["question"]
+                # Anything that is not POSITIVE/NEGATIVE/PENDING counts as neutral
+                key = sentiment_key({"SentiAnalysis": {"label": group.get("label")}})
+                counts = counters.setdefault(qid, dict.fromkeys(SENTIMENT_KEYS + ('total',), 0))
+                counts[key] += doc["count"]
+                counts['total'] += doc["count"]
+                totals[key] += doc["count"]
+                totals['answers'] += doc["count"]
+            totals['surveys'] = self.surveys_collection.count_documents({})
+            
+            return {
+                "success": True,
+                "source": "aggregation",
+                "totals": totals,
+                "questions": self._question_counts(counters, legacy_texts)
+            }
+            
+        except Exception as e:
+            logging.error(f"Error aggregating question sentiment in MongoDB: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    @timed_operation
+    def rebuild_rollups(self, batch_size=1000):
+        """Recompute the analytics rollups and time buckets while surveys keep being saved
+        
+        Every survey is streamed once; meanwhile writers keep updating the live
+        counters and note which surveys they change. Writers then pause while
+        those surveys are re-read and the recomputed counters are swapped in,
+        so no save made during the rebuild is lost or counted twice. The first
+        rebuild marks the counters as built, from when on saves maintain them.
+        """
+        try:
+            self._ensure_connection()
+            token = self._begin_rebuild()
+            if token is None:
+                raise Exception("Another rollup rebuild is running")
+            built = False
+            try:
+                # Writers that read (or cached) the state before the rebuild began finish meanwhile
+                time.sleep(ROLLUP_STATE_TTL + Config.rollup_rebuild_grace)
+                
+                totals, questions = empty_rollup()
+                buckets = {}
+                counted = {}
+                batch = []
+                cursor = self.surveys_collection.find({}, ROLLUP_PROJECTION, batch_size=batch_size)
+                with cursor:
+                    for survey in cursor:
+                        accumulate_rollup(totals, questions, survey, 1)
+                        accumulate_buckets(buckets, survey, 1)
+                        counted[survey.get("surveyId")] = compact_counted(survey)
+                        batch.append(survey)
+                        if len(batch) >= batch_size:
+                            self._register_legacy_questions(batch)
+                            batch = []
+                            if not self._set_rebuild_phase(token, "scan", ROLLUP_REBUILD_LEASE_SECONDS):
+                                raise Exception("Rebuild lease lost")
+                self._register_legacy_questions(batch)
+                
+                # Pause writers, then recount what they changed during the scan
+                if not self._set_rebuild_phase(token, "swap", ROLLUP_SWAP_SECONDS):
+                    raise Exception("Rebuild lease lost")
+                time.sleep(Config.rollup_rebuild_grace)
+                touched = [
+                    doc["_id"].split(":", 1)[1]
+                    for doc in self.rollups_collection.find({"scope": "touched"}, {"_id": 1})
+                ]
+                for start in range(0, len(touched), batch_size):
+                    survey_ids = touched[start:start + batch_size]
+                    current = self.surveys_collection.find({"surveyId": {"$in": survey_ids}}, ROLLUP_PROJECTION)
+                    for survey in current:
+                        accumulate_rollup(totals, questions, survey, 1)
+                        accumulate_buckets(buckets, survey, 1)
+                    for survey_id in survey_ids:
+                        if survey_id in counted:
+                            previous = expand_counted(counted[survey_id])
+                            accumulate_rollup(totals, questions, previous, -1)
+                            accumulate_buckets(buckets, previous, -1)
+                
+                questions = {qid: counts for qid, counts in questions.items() if counts["total"] > 0}
+                operations = [ReplaceOne({"_id": "totals"}, {"scope": "totals", **totals}, upsert=True)]
+                for qid, counts in questions.items():
+                    operations.append(ReplaceOne(
+                        {"_id": f"question:{qid}"},
+                        {"scope": "question", "questionId": qid, **counts},
+                        upsert=True
+                    ))
+                self.rollups_collection.bulk_write(operations, ordered=False)
+                # Drop questions that no longer appear in any survey (and counters
+                # still keyed by question text), and the notes of the writers
+                self.rollups_collection.delete_many({"$or": [
+                    {"scope": "question", "_id": {"$nin": [f"question:{qid}" for qid in questions]}},
+                    {"scope": "touched"}
+                ]})
+                
+                buckets = {
+                    (granularity, start): (bucket_totals, bucket_questions)
+                    for (granularity, start), (bucket_totals, bucket_questions) in buckets.items()
+                    if bucket_totals["surveys"] > 0
+                }
+                operations = [
+                    ReplaceOne(
+                        {"_id": f"{granularity}:{start}"},
+                        {
+                            "granularity": granularity,
+                            "start": start,
+                            **bucket_totals,
+                            "questions": {
+                                qid: counts for qid, counts in bucket_questions.items() if counts["total"] > 0
+                            }
+                        },
+                        upsert=True
+                    )
+                    for (granularity, start), (bucket_totals, bucket_questions) in buckets.items()
+                ]
+                for chunk in range(0, len(operations), batch_size):
+                    self.buckets_collection.bulk_write(operations[chunk:chunk + batch_size], ordered=False)
+                # Drop buckets whose surveys have all been deleted
+                self.buckets_collection.delete_many({
+                    "_id": {"$nin": [f"{granularity}:{start}" for granularity, start in buckets]}
+                })
+                built = True
+            finally:
+                self._end_rebuild(token, built)
+            self.bump_data_version()
+            
+            return {
+                "success": True,
+                "surveys": totals['surveys'],
+                "questions": len(questions),
+                "buckets": len(buckets)
+            }
+            
+        except Exception as e:
+            logging.error(f"Error rebuilding analytics rollups: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    @timed_operation
+    def get_analytics_buckets(self, granularity, start=None, end=None):
+        """Hourly or daily sentiment buckets with start <= bucket < end, oldest first
+        
+        `start` / `end` are bucket keys as produced by bucket_key().
+        """
+        try:
+            self._ensure_connection()
+            
+            query = {"granularity": granularity}
+            if start or end:
+                query["start"] = {}
+                if start:
+                    query["start"]["$gte"] = start
+                if end:
+                    query["start"]["$lt"] = end
+            
+            built, _ = self._rollup_state()
+            if built:
+                docs = list(self.buckets_collection.find(query, {"_id": 0}).sort("start", 1))
+            else:
+                # Buckets have never been built; count the surveys in the range instead
+                docs = self._aggregate_buckets(granularity, start, end)
+            texts = self.question_texts({qid for doc in docs for qid in doc.get("questions", {})})
+            
+            buckets = []
+            for doc in docs:
+                buckets.append({
+                    "start": doc["start"],
+                    "totals": {key: doc.get(key, 0) for key in ('surveys', 'answers') + SENTIMENT_KEYS},
+                    "questions": [
+                        {
+                            "questionId": qid,
+                            "question": texts[qid],
+                            **{key: counts.get(key, 0) for key in SENTIMENT_KEYS + ('total',)}
+                        }
+                        for qid, counts in doc.get("questions", {}).items()
+                        # Saves leave questions whose answers all moved elsewhere at zero
+                        if counts.get("total", 0) > 0
+                    ]
+                })
+            
+            return {
+                "success": True,
+                "buckets": buckets
+            }
+            
+        except Exception as e:
+            logging.error(f"Error retrieving analytics buckets from MongoDB: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+    
+    def _aggregate_buckets(self, granularity, start=None, end=None):
+        """Bucket documents for start <= bucket < end computed from the surveys, oldest first"""
+        # Bucket keys are prefixes of the ISO completedAt strings, so they bound them as well
+        query = {}
+        if start:
+            query["$gte"] = start
+        if end:
+            query["$lt"] = end
+        buckets = {}
+        batch = []
+        cursor = self.surveys_collection.find(
+            {"completedAt": query} if query else {}, ROLLUP_PROJECTION, batch_size=1000
+        )
+        with cursor:
+            for survey in cursor:
+                accumulate_buckets(buckets, survey, 1)
+                batch.append(survey)
+                if len(batch) >= 1000:
+                    self._register_legacy_questions(batch)
+                    batch = []
+        self._register_legacy_questions(batch)
+        return [
+            {"granularity": granularity, "start": key, **totals, "questions": questions}
+            for (bucket_granularity, key), (totals, questions) in sorted(buckets.items())
+            if bucket_granularity == granularity
+            and (not start or key >= start) and (not end or key < end)
+        ]
+    
+    @timed_operation
+    def get_cached_sentiments(self, keys):
+        """Look up cached sentiment labels by content key; returns {key: label}"""
+        self._ensure_connection()
+        
+        return {
+            doc["_id"]: doc["label"]
+            for doc in self.sentiment_cache_collection.find({"_id": {"$in": list(keys)}})
+        }
+    
+    @timed_operation
+    def cache_sentiments(self, labels):
+        """Store {key: label} sentiment results shared by all workers"""
+        if not labels:
+            return
+        
+        self._ensure_connection()
+        now = datetime.now(timezone.utc)
+        self.sentiment_cache_collection.bulk_write([
+            UpdateOne({"_id": key}, {"$set": {"label": label, "createdAt": now}}, upsert=True)
+            for key, label in labels.items()
+        ], ordered=False)
+    
+    @timed_operation
+    def _index_answers(self, surveys, replaced=(), removed=()):
+        """Bring the answer search index up to date with saved (or deleted) surveys; False on failure
+        
+        `replaced` are the IDs of saved surveys that existed before: their
+        entries are replaced and those of answers the new version lacks
+        deleted. Answers of new surveys are simply inserted.
+        """
+        operations = [DeleteMany({"surveyId": survey_id}) for survey_id in removed]
+        inserted = {}  # position in operations -> document, for new surveys
+        replaced = set(replaced)
+        now = datetime.now(timezone.utc)
+        for survey in surveys:
+            documents = [{**document, "indexedAt": now} for document in answer_documents(survey)]
+            if survey["surveyId"] in replaced:
+                # Answers the new version no longer has
+                operations.append(DeleteMany({
+                    "surveyId": survey["surveyId"],
+                    "_id": {"$nin": [document["_id"] for document in documents]}
+                }))
+                operations.extend(
+                    ReplaceOne({"_id": document["_id"]}, document, upsert=True)
+                    for document in documents
+                )
+            else:
+                for document in documents:
+                    inserted[len(operations)] = document
+                    operations.append(InsertOne(document))
+        if not operations:
+            return True
+        try:
+            try:
+                self.answers_collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != 11000 or error["index"] not in inserted for error in errors):
+                    raise
+                # Entries left behind for a "new" survey, e.g. by a delete whose index update failed
+                self.answers_collection.bulk_write([
+                    ReplaceOne({"_id": inserted[error["index"]]["_id"]}, inserted[error["index"]], upsert=True)
+                    for error in errors
+                ], ordered=False)
+            return True
+        except Exception as e:
+            # The surveys are stored; `flask rebuild-search-index` repairs the index
+            logging.error(f"Error updating answer search index: {e}")
+            return False
+    
+    def _relabel_indexed_answers(self, labels):
+        """Update the sentiment of indexed answers from (surveyId, index, answer, label)"""
+        if not labels:
+            return
+        try:
+            self.answers_collection.bulk_write([
+                UpdateOne({"_id": f"{survey_id}:{index}", "answer": answer}, {"$set": {"label": label}})
+                for survey_id, index, answer, label in labels
+            ], ordered=False)
+        except Exception as e:
+            logging.error(f"Error updating answer search index: {e}")
+    
+    @timed_operation
+    def search_answers(self, text, question_id=None, label=None, completed=None, limit=20, after=None):
+        """Answers matching a text search, best match first, with keyset pagination
+        
+        Uses the `answer_text` index of the survey_answers collection; filters
+        apply to the matches. `completed` is a completed_at_query() filter and
+        `after` the (score, _id) of the last hit of the previous page. Only the
+        SEARCH_MAX_HITS best matches are ranked, so a common word costs a
+        bounded top-k sort rather than sorting every match on each page.
+        Returns {"success", "hits", "next"}.
+        """
+        try:
+            self._ensure_connection()
+            
+            query = {"$text": {"$search": text}, **(completed or {})}
+            if question_id:
+                query["questionId"] = question_id
+            if label:
+                query["label"] = label
+            
+            pipeline = [
+                {"$match": query},
+                {"$sort": {"score": {"$meta": "textScore"}, "_id": 1}},
+                {"$limit": SEARCH_MAX_HITS},
+                {"$addFields": {"score": {"$meta": "textScore"}}}
+            ]
+            if after is not None:
+                score, last_id = after
+                pipeline.append({"$match": {"$or": [
+                    {"score": {"$lt": score}},
+                    {"score": score, "_id": {"$gt": last_id}}
+                ]}})
+            pipeline += [
+                {"$sort": {"score": -1, "_id": 1}},
+                {"$limit": limit + 1}
+            ]
+            
+            hits = list(self.answers_collection.aggregate(pipeline, allowDiskUse=True))
+            next_key = None
+            if len(hits) > limit:
+                hits = hits[:limit]
+                next_key = (hits[-1]["score"], hits[-1]["_id"])
+            
+            texts = self.question_texts({hit["questionId"] for hit in hits})
+            return {
+                "success": True,
+                "hits": [
+                    {
+                        "surveyId": hit["surveyId"],
+                        "index": hit["index"],
+                        "questionId": hit["questionId"],
+                        "question": texts[hit["questionId"]],
+                        "answer": hit["answer"],
+                        "sentiment": hit.get("label"),
+                        "completedAt": hit.get("completedAt"),
+                        "score": hit["score"]
+                    }
+                    for hit in hits
+                ],
+                "next": next_key
+            }
+            
+        except Exception as e:
+            logging.error(f"Error searching answers in MongoDB: {e}")
+            return {
+                "success": False,
+                "hits": [],
+                "error": str(e)
+            }
+    
+    @timed_operation
+    def rebuild_answer_index(self, batch_size=1000):
+        """Re-create the answer search index from the surveys collection"""
+        self._ensure_connection()
+        started = datetime.now(timezone.utc)
+        surveys = 0
+        batch = []
+        cursor = self.surveys_collection.find(
+            {},
+            {"_id": 0, "surveyId": 1, "completedAt": 1, "responses": 1},
+            batch_size=batch_size
+        )
+        with cursor:
+            for survey in cursor:
+                batch.append(survey)
+                surveys += 1
+                if len(batch) >= batch_size:
+                    self._register_legacy_questions(batch)
+                    if not self._index_answers(batch):
+                        raise Exception("Failed to index a batch of surveys, see the log")
+                    batch = []
+        self._register_legacy_questions(batch)
+        if batch and not self._index_answers(batch):
+            raise Exception("Failed to index a batch of surveys, see the log")
+        
+        # Anything not written since the rebuild started belongs to a deleted survey
+        self.answers_collection.delete_many({"indexedAt": {"$lt": started}})
+        
+        return {
+            "surveys": surveys,
+            "answers": self.answers_collection.count_documents({})
+        }
+    
+    def enqueue_sentiment_job(self, survey_id, items):
+        """Queue a survey's PENDING answers for the background sentiment worker"""
+        return self.enqueue_sentiment_jobs({survey_id: items})
+    
+    @timed_operation
+    def enqueue_sentiment_jobs(self, jobs):
+        """Queue {surveyId: items} PENDING answers of several surveys in one insert"""
+        if not jobs:
+            return {"success": True}
+        
+        try:
+            self._ensure_connection()
+            
+            now = datetime.now(timezone.utc)
+            self.sentiment_jobs_collection.insert_many([
+                {
+                    "surveyId": survey_id,
+                    "items": items,
+                    "status": "pending",
+                    "attempts": 0,
+                    "availableAt": now,
+                    "createdAt": now
+                }
+                for survey_id, items in jobs.items()
+            ], ordered=False)
+            return {"success": True}
+            
+        except Exception as e:
+            # The surveys stay PENDING; `flask sentiment-worker --requeue` picks them up
+            logging.error(f"Error queueing sentiment jobs for {len(jobs)} surveys: {e}")
+            return {"success": False, "error": str(e)}
+    
+    @timed_operation
+    def claim_sentiment_jobs(self, limit, lease_seconds=300):
+        """Atomically lease up to `limit` due jobs to the calling worker
+        
+        A job whose worker dies becomes available again once its lease expires.
+        """
+        self._ensure_connection()
+        now = datetime.now(timezone.utc)
+        lease_until = now + timedelta(seconds=lease_seconds)
+        jobs = []
+        
+        while len(jobs) < limit:
+            job = self.sentiment_jobs_collection.find_one_and_update(
+                {"status": {"$in": ["pending", "processing"]}, "availableAt": {"$lte": now}},
+                {"$set": {"status": "processing", "availableAt": lease_until}, "$inc": {"attempts": 1}},
+                sort=[("availableAt", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if job is None:
+                break
+            jobs.append(job)
+        
+        return jobs
+    
+    @timed_operation
+    def complete_sentiment_job(self, job, labels, model=None):
+        """Write a job's labels into its survey and remove it from the queue
+        
+        `labels` are parallel to job["items"] and are stored with the `model`
+        version that produced them. The survey is only updated if the answers
+        are still PENDING and unchanged, so a re-submitted survey is never
+        overwritten with labels for its previous answers.
+        """
+        self._ensure_connection()
+        condition = {"surveyId": job["surveyId"]}
+        update = {}
+        for item, label in zip(job["items"], labels):
+            condition[f"responses.{item['index']}.answer"] = item["answer"]
+            condition[f"responses.{item['index']}.SentiAnalysis.label"] = "PENDING"
+            update[f"responses.{item['index']}.SentiAnalysis"] = {"label": label, "model": model}
+        state = self._rollup_state()
+        
+        survey = self.surveys_collection.find_one_and_update(
+            condition,
+            {"$set": update},
+            projection={"_id": 0, "completedAt": 1}
+        )
+        
+        if survey is not None:
+            # Move the answers from the pending counters to their new labels
+            # (surveys +1/-1 cancel out, so only the answer counters change)
+            self._update_rollups(
+                state,
+                survey_ids=[job["surveyId"]],
+                added={"completedAt": survey.get("completedAt"), "responses": [
+                    {"questionId": response_question_id(item), "SentiAnalysis": {"label": label}}
+                    for item, label in zip(job["items"], labels)
+                ]},
+                removed={"completedAt": survey.get("completedAt"), "responses": [
+                    {"questionId": response_question_id(item), "SentiAnalysis": {"label": "PENDING"}}
+                    for item in job["items"]
+                ]}
+            )
+            self._relabel_indexed_answers([
+                (job["surveyId"], item["index"], item["answer"], label)
+                for item, label in zip(job["items"], labels)
+            ])
+        
+        self.sentiment_jobs_collection.delete_one({"_id": job["_id"]})
+        return survey is not None
+    
+    def fail_sentiment_job(self, job, error, max_attempts=5, retry_delay=30):
+        """Release a job for a later retry, or park it as failed after max_attempts"""
+        self._ensure_connection()
+        if job.get("attempts", 0) >= max_attempts:
+            update = {"status": "failed", "error": str(error)}
+        else:
+            # Exponential backoff between attempts
+            delay = retry_delay * 2 ** (job.get("attempts", 1) - 1)
+            update = {
+                "status": "pending",
+                "error": str(error),
+                "availableAt": datetime.now(timezone.utc) + timedelta(seconds=delay)
+            }
+        self.sentiment_jobs_collection.update_one({"_id": job["_id"]}, {"$set": update})
+    
+    @timed_operation
+    def relabel_answers(self, changes, model):
+        """Overwrite answer labels in bulk and move the rollup counters accordingly
+        
+        `changes` is a list of (survey, [(index, old_label, new_label), ...]).
+        An update only applies if the answer still has its old label and text,
+        so surveys re-submitted meanwhile are left alone. Returns
+        {"expected", "matched"}; fewer matches than expected means the rollups
+        may have drifted and should be rebuilt.
+        """
+        if not changes:
+            return {"expected": 0, "matched": 0}
+        
+        self._ensure_connection()
+        operations = []
+        added = []
+        removed = []
+        for survey, answers in changes:
+            condition = {"surveyId": survey["surveyId"]}
+            update = {}
+            for index, old_label, new_label in answers:
+                response = survey["responses"][index]
+                condition[f"responses.{index}.answer"] = response.get("answer")
+                condition[f"responses.{index}.SentiAnalysis.label"] = old_label
+                update[f"responses.{index}.SentiAnalysis"] = {"label": new_label, "model": model}
+            operations.append(UpdateOne(condition, {"$set": update}))
+            
+            # Only answers whose label actually changes affect the counters
+            moved = [
+                (response_question_id(survey["responses"][index]), old_label, new_label)
+                for index, old_label, new_label in answers
+                if old_label != new_label
+            ]
+            if moved:
+                added.append({"completedAt": survey.get("completedAt"), "responses": [
+                    {"questionId": qid, "SentiAnalysis": {"label": new_label}}
+                    for qid, _, new_label in moved
+                ]})
+                removed.append({"completedAt": survey.get("completedAt"), "responses": [
+                    {"questionId": qid, "SentiAnalysis": {"label": old_label}}
+                    for qid, old_label, _ in moved
+                ]})
+        
+        state = self._rollup_state()
+        result = self.surveys_collection.bulk_write(operations, ordered=False)
+        self._update_rollups(
+            state,
+            added=added,
+            removed=removed,
+            survey_ids=[survey["surveyId"] for survey, _ in changes]
+        )
+        self._relabel_indexed_answers([
+            (survey["surveyId"], index, survey["responses"][index].get("answer"), new_label)
+            for survey, answers in changes
+            for index, _, new_label in answers
+        ])
+        return {"expected": len(operations), "matched": result.matched_count}
+    
+    def get_checkpoint(self, name):
+        """Saved progress of a resumable job, or None"""
+        self._ensure_connection()
+        return self.checkpoints_collection.find_one({"_id": name}, {"_id": 0})
+    
+    def save_checkpoint(self, name, state):
+        """Record the progress of a resumable job"""
+        self._ensure_connection()
+        self.checkpoints_collection.replace_one(
+            {"_id": name},
+            {**state, "updatedAt": datetime.now(timezone.utc)},
+            upsert=True
+        )
+    
+    def delete_checkpoint(self, name):
+        self._ensure_connection()
+        self.checkpoints_collection.delete_one({"_id": name})
+    
+    def release_sentiment_job(self, job, delay=0):
+        """Return a claimed job to the queue without counting the attempt"""
+        self._ensure_connection()
+        self.sentiment_jobs_collection.update_one(
+            {"_id": job["_id"]},
+            {
+                "$set": {
+                    "status": "pending",
+                    "availableAt": datetime.now(timezone.utc) + timedelta(seconds=delay)
+                },
+                "$inc": {"attempts": -1}
+            }
+        )
+    
+    def requeue_pending_surveys(self):
+        """Queue jobs for PENDING answers that have no job (e.g. enqueue failed)"""
+        self._ensure_connection()
+        queued = set(self.sentiment_jobs_collection.distinct("surveyId"))
+        count = 0
+        for survey in self.surveys_collection.find(
+            {"responses.SentiAnalysis.label": "PENDING"},
+            {"_id": 0, "surveyId": 1, "responses": 1}
+        ):
+            if survey["surveyId"] in queued:
+                continue
+            items = [
+                {"index": index, "questionId": response_question_id(response), "answer": response.get("answer", "")}
+                for index, response in enumerate(survey.get("responses", []))
+                if (response.get("SentiAnalysis") or {}).get("label") == "PENDING"
+            ]
+            if self.enqueue_sentiment_job(survey["surveyId"], items)["success"]:
+                count += 1
+        return count
+    
+    @timed_operation
+    def register_questions(self, texts, source="survey"):
+        """Add questions to the catalog (if new) and return their IDs, parallel to `texts`
+        
+        The first text seen for an ID becomes its display text; later near
+        duplicates (same normalized text) share that entry.
+        """
+        ids = [question_id(text) for text in texts]
+        new = {qid: text for qid, text in zip(ids, texts) if qid not in self._question_texts}
+        if not new:
+            return ids
+        
+        self._ensure_connection()
+        now = datetime.now(timezone.utc)
+        self.question_catalog_collection.bulk_write([
+            UpdateOne(
+                {"_id": qid},
+                {"$setOnInsert": {
+                    "text": text,
+                    "key": normalize_question(text),
+                    "source": source,
+                    "createdAt": now
+                }},
+                upsert=True
+            )
+            for qid, text in new.items()
+        ], ordered=False)
+        # Another text may have registered the ID first; cache the stored one
+        self.question_texts(new)
+        return ids
+    
+    def question_texts(self, ids, fallback=None):
+        """{questionId: display text} from the catalog, cached in-process
+        
+        IDs missing from the catalog map to `fallback[id]`, or the ID itself.
+        """
+        missing = [qid for qid in ids if qid not in self._question_texts]
+        if missing:
+            self._ensure_connection()
+            if len(self._question_texts) > QUESTION_TEXT_CACHE_SIZE:
+                self._question_texts = {}
+            for doc in self.question_catalog_collection.find({"_id": {"$in": missing}}, {"text": 1}):
+                self._question_texts[doc["_id"]] = doc["text"]
+        fallback = fallback or {}
+        return {qid: self._question_texts.get(qid) or fallback.get(qid, qid) for qid in ids}
+    
+    def _catalog_responses(self, surveys):
+        """Replace each response's question text with its catalog questionId, in place"""
+        texts = []
+        for survey in surveys:
+            for response in survey.get("responses") or []:
+                text = response.pop("question", None)
+                if text is None and response.get("questionId"):
+                    continue
+                response["questionId"] = question_id(text or "Unknown")
+                texts.append(text or "Unknown")
+        if texts:
+            self.register_questions(list(dict.fromkeys(texts)))
+    
+    def _register_legacy_questions(self, surveys):
+        """Add the question texts of responses saved before the catalog to it
+        
+        Their counters and index entries are keyed by the hash of that text,
+        which otherwise would not resolve to a display text until the
+        surveys are migrated.
+        """
+        texts = {
+            response.get("question") or "Unknown"
+            for survey in surveys
+            for response in survey.get("responses") or []
+            if not response.get("questionId")
+        }
+        if texts:
+            self.register_questions(sorted(texts), source="legacy")
+    
+    def _hydrate_questions(self, surveys):
+        """Fill in the question text of responses that only reference a questionId, in place"""
+        responses = [
+            response
+            for survey in surveys
+            for response in survey.get("responses") or []
+            if "question" not in response and response.get("questionId")
+        ]
+        if not responses:
+            return
+        texts = self.question_texts({response["questionId"] for response in responses})
+        for response in responses:
+            response["question"] = texts[response["questionId"]]
+    
+    def _question_counts(self, counters, legacy_texts):
+        """Per-question counter rows with display texts, most answered first"""
+        if legacy_texts:
+            self.register_questions(sorted(set(legacy_texts.values())), source="legacy")
+        texts = self.question_texts(set(counters), fallback=legacy_texts)
+        return sorted(
+            (
+                {"questionId": qid, "question": texts[qid], **counts}
+                for qid, counts in counters.items()
+                if counts["total"] > 0
+            ),
+            key=lambda counts: (-counts["total"], counts["question"])
+        )
+    
+    def migrate_question_ids(self, batch_size=500):
+        """Move surveys saved with full question texts onto catalog questionIds
+        
+        Each survey is rewritten only if its responses are unchanged since
+        they were read. The counters are keyed the same way before and after,
+        so rollups stay valid while this runs.
+        """
+        self._ensure_connection()
+        migrated = 0
+        skipped = 0
+        batch = []
+        
+        def flush():
+            nonlocal migrated, skipped
+            operations = []
+            for survey in batch:
+                original = [dict(response) for response in survey["responses"]]
+                self._catalog_responses([survey])
+                operations.append(UpdateOne(
+                    {"surveyId": survey["surveyId"], "responses": original},
+                    {"$set": {"responses": survey["responses"]}}
+                ))
+            result = self.surveys_collection.bulk_write(operations, ordered=False)
+            migrated += result.modified_count
+            skipped += len(operations) - result.matched_count
+            batch.clear()
+        
+        cursor = self.surveys_collection.find(
+            {"responses.question": {"$exists": True}},
+            {"_id": 0, "surveyId": 1, "responses": 1},
+            batch_size=batch_size
+        )
+        with cursor:
+            for survey in cursor:
+                batch.append(survey)
+                if len(batch) >= batch_size:
+                    flush()
+        if batch:
+            flush()
+        
+        # Pool questions generated before the catalog existed
+        pool = [doc["question"] for doc in self.question_pool_collection.find({}, {"question": 1})]
+        if pool:
+            self.register_questions(pool, source="generated")
+        
+        return {
+            "migrated": migrated,
+            "skipped": skipped,
+            "questions": self.question_catalog_collection.count_documents({})
+        }
+    
+    def add_pool_questions(self, questions):
+        """Add generated questions to the pool, skipping ones already present
+        
+        Returns the number of questions that were new.
+        """
+        if not questions:
+            return 0
+        
+        self._ensure_connection()
+        self.register_questions(questions, source="generated")
+        operations = [
+            UpdateOne(
+                {"key": normalize_question(question)},
+                {"$setOnInsert": {
+                    "question": question,
+                    "servedCount": 0,
+                    "lastServedAt": datetime.fromtimestamp(0, timezone.utc),
+                    "createdAt": datetime.now(timezone.utc)
+                }},
+                upsert=True
+            )
+            for question in questions
+        ]
+        result = self.question_pool_collection.bulk_write(operations, ordered=False)
+        return result.upserted_count
+    
+    @timed_operation
+    def take_pool_questions(self, count, max_serves=0):
+        """Serve the `count` least recently served questions and mark them as served
+        
+        With max_serves > 0, questions served that many times are retired and
+        only returned when nothing fresher is left.
+        """
+        self._ensure_connection()
+        query = {"servedCount": {"$lt": max_serves}} if max_serves else {}
+        docs = list(self.question_pool_collection.find(
+            query,
+            {"_id": 1, "question": 1}
+        ).sort([("servedCount", 1), ("lastServedAt", 1)]).limit(count))
+        
+        if len(docs) < count and max_serves:
+            # Pool is exhausted; reuse retired questions rather than failing
+            docs += list(self.question_pool_collection.find(
+                {"_id": {"$nin": [doc["_id"] for doc in docs]}},
+                {"_id": 1, "question": 1}
+            ).sort("lastServedAt", 1).limit(count - len(docs)))
+        
+        if docs:
+            self.question_pool_collection.update_many(
+                {"_id": {"$in": [doc["_id"] for doc in docs]}},
+                {"$set": {"lastServedAt": datetime.now(timezone.utc)}, "$inc": {"servedCount": 1}}
+            )
+        return [doc["question"] for doc in docs]
+    
+    def count_pool_questions(self, max_serves=0):
+        """Number of pool questions that can still be served"""
+        self._ensure_connection()
+        query = {"servedCount": {"$lt": max_serves}} if max_serves else {}
+        return self.question_pool_collection.count_documents(query)
+    
+    def acquire_lock(self, name, seconds, force=False):
+        """Take a cross-process lock that expires after `seconds`
+        
+        Returns a token for release_lock, or None if someone else holds it.
+        `force` takes the lock even then, e.g. from a process that was killed.
+        """
+        self._ensure_connection()
+        now = datetime.now(timezone.utc)
+        token = uuid.uuid4().hex
+        try:
+            self.locks_collection.update_one(
+                {"_id": name} if force else {"_id": name, "expiresAt": {"$lt": now}},
+                {"$set": {"expiresAt": now + timedelta(seconds=seconds), "token": token}},
+                upsert=True
+            )
+            return token
+        except DuplicateKeyError:
+            return None
+    
+    def renew_lock(self, name, token, seconds):
+        """Extend a lock taken with acquire_lock to `seconds` from now; False if it was lost"""
+        self._ensure_connection()
+        result = self.locks_collection.update_one(
+            {"_id": name, "token": token},
+            {"$set": {"expiresAt": datetime.now(timezone.utc) + timedelta(seconds=seconds)}}
+        )
+        return result.matched_count == 1
+    
+    def release_lock(self, name, token):
+        """Release a lock taken with acquire_lock"""
+        self._ensure_connection()
+        self.locks_collection.delete_one({"_id": name, "token": token})
+    
     def close_connection(self):
         """Close MongoDB connection"""
+        # Buffered surveys still need the client
+        self.flush_write_buffer()
         if self.client:
             self.client.close()
             self.client = None
+            self._pid = None
             self.db = None
             self.surveys_collection = None
+            self.rollups_collection = None
+            self.buckets_collection = None
+            self.sentiment_cache_collection = None
+            self.sentiment_jobs_collection = None
+            self.question_pool_collection = None
+            self.question_catalog_collection = None
+            self.locks_collection = None
+            self.checkpoints_collection = None
+            self.response_cache_collection = None
+            self.analytics_events_collection = None
+            self.live_dashboards_collection = None
+            self.answers_collection = None
 
 # Global MongoDB manager instance
 mongodb_manager = MongoDBManager()
@@ -0,0 +1,158 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from utils.metrics import WRITE_BUFFER_BATCH_SIZE, WRITE_BUFFER_EVENTS
+
+# How often an idle flusher checks whether close() was called
+IDLE_POLL_SECONDS = 0.5
+
+
+class SurveyWriteBuffer:
+    """Coalesces one worker's single-survey saves into unordered bulk writes
+
+    submit() queues a survey and blocks until the flush that wrote it is
+    done, so callers are only acknowledged once their survey is stored. A
+    flusher thread takes what is waiting once `max_batch_size` surveys have
+    gathered or `flush_interval_ms` after the first of them, and writes the
+    lot with `store.save_surveys` (one bulk write and one rollup update)
+    followed by a single insert of their sentiment jobs.
+
+    At most `max_pending` surveys wait at a time. Beyond that submit() blocks,
+    and after `timeout` seconds gives up with a "busy" result instead of
+    letting the backlog grow. close() flushes what is left; surveys submitted
+    afterwards are written straight away.
+    """
+
+    def __init__(self, store, max_batch_size=500, flush_interval_ms=20, max_pending=5000, timeout=30.0):
+        self.store = store
+        self.max_batch_size = max_batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._pending = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="survey-write-buffer", daemon=True)
+        self._thread.start()
+
+    def submit(self, survey, pending_items=None):
+        """Save a survey (and queue its PENDING answers) in the next flush; returns its result"""
+        future = Future()
+        if self._closed:
+            self._flush([(survey, pending_items, future)])
+            return future.result()
+
+        deadline = time.monotonic() + self.timeout
+        try:
+            self._pending.put((survey, pending_items, future), timeout=self.timeout)
+        except queue.Full:
+            WRITE_BUFFER_EVENTS.labels(event='rejected').inc()
+            return {
+                "success": False,
+                "busy": True,
+                "error": f"Write buffer full ({self.max_pending} surveys waiting)"
+            }
+
+        try:
+            return future.result(timeout=max(0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            # Still queued or being written: the outcome is unknown to the caller
+            WRITE_BUFFER_EVENTS.labels(event='timeout').inc()
+            return {"success": False, "error": f"Not acknowledged within {self.timeout}s"}
+
+    def close(self, timeout=None):
+        """Flush every queued survey and stop the flusher thread"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping.set()
+        try:
+            # Wakes the flusher right away; with a full queue it stops once that is drained
+            self._pending.put_nowait(None)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.error("Survey write buffer did not drain before shutdown")
+            return
+
+        # Submitted while closing, after the flusher's last batch
+        leftovers = []
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                leftovers.append(item)
+        if leftovers:
+            self._flush(leftovers)
+
+    def _next_batch(self):
+        """Surveys to write next, and whether close() was requested meanwhile"""
+        while True:
+            try:
+                first = self._pending.get(timeout=IDLE_POLL_SECONDS)
+                break
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return [], True
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, closing = self._next_batch()
+            if batch:
+                self._flush(batch)
+            if closing:
+                return
+
+    def _flush(self, batch):
+        WRITE_BUFFER_BATCH_SIZE.observe(len(batch))
+        try:
+            results = self._write(batch)
+        except Exception as e:
+            logging.error(f"Error flushing {len(batch)} buffered surveys: {e}")
+            results = [{"success": False, "error": str(e)}] * len(batch)
+
+        for (_, _, future), result in zip(batch, results):
+            WRITE_BUFFER_EVENTS.labels(event='saved' if result["success"] else 'failed').inc()
+            future.set_result(result)
+
+    def _write(self, batch):
+        """Results, in order, of writing (survey, pending_items, future) entries together"""
+        surveys = [survey for survey, _, _ in batch]
+        result = self.store.save_surveys(surveys, chunk_size=len(surveys))
+        errors = {error["index"]: error["error"] for error in result["errors"]}
+
+        # PENDING answers of the stored surveys, for the sentiment worker
+        self.store.enqueue_sentiment_jobs({
+            survey["surveyId"]: items
+            for index, (survey, items, _) in enumerate(batch)
+            if items and index not in errors
+        })
+
+        return [
+            {"success": False, "error": errors[index]} if index in errors
+            else {"success": True, "surveyId": survey["surveyId"], "batchSize": len(batch)}
+            for index, survey in enumerate(surveys)
+        ]
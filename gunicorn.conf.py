@@ -1 +1,69 @@
-import os
\ No newline at end of file
+import multiprocessing
+import os
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+
+# Requests spend most of their time waiting on MongoDB, Gemini and the sentiment
+# model, so each worker serves many of them at once instead of one:
+# - gthread (default): `threads` requests in flight per worker; a slow model
+#   call blocks one thread, not the whole worker
+# - gevent: `worker_connections` cooperative requests per worker (pip install gevent)
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# One process per core is enough once the threads absorb the waiting
+workers = int(os.getenv('GUNICORN_WORKERS', str(multiprocessing.cpu_count())))
+threads = int(os.getenv('GUNICORN_THREADS', '200'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+# Heartbeats come from the worker's main loop, so this only fires for a truly
+# stuck worker; slow requests are bounded by SENTIMENT_TIMEOUT instead
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+# The analytics page polls, so keep its connections open between requests
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+# Bounded backlog: beyond this, clients get connection errors instead of
+# waiting in a queue that has already outlived their timeouts
+backlog = int(os.getenv('GUNICORN_BACKLOG', '2048'))
+
+# Workers write their metrics to files here so /metrics can report all of them.
+# Must be set before prometheus_client is imported (i.e. before the app loads).
+prometheus_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'survey-app-metrics')
+)
+os.makedirs(prometheus_dir, exist_ok=True)
+
+# Load the app once in the master so workers fork with the code already imported.
+# Safe because MongoDB, Gemini and sentiment clients are only created on first use
+# inside each worker.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+
+def on_starting(server):
+    # Samples of a previous run would otherwise be added to this one. Cleared once
+    # per master rather than on import: this file is re-read on every HUP, while
+    # the workers keep writing here. The preloaded master's own files stay.
+    own = f'_{os.getpid()}.db'
+    for name in os.listdir(prometheus_dir):
+        if not name.endswith(own):
+            try:
+                os.remove(os.path.join(prometheus_dir, name))
+            except FileNotFoundError:
+                pass
+
+
+def post_fork(server, worker):
+    # Belt and braces: drop any client the master may have created before fork
+    from database.db_utils import mongodb_manager
+    mongodb_manager.reset_after_fork()
+
+
+def worker_exit(server, worker):
+    # Writes out any surveys still in the write buffer before disconnecting
+    from database.db_utils import mongodb_manager
+    mongodb_manager.close_connection()
+
+
+def child_exit(server, worker):
+    # Keep the dead worker's counters, drop its live-only samples
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
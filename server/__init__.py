@@ -1,12 +1,35 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask
 from flask_cors import CORS
 import logging
 
 # Flask app instance
 logging.basicConfig(level=logging.INFO)
-app = Flask(__name__, static_folder='../static', template_folder='../templates')
+# Static files are served by server/assets.py rather than Flask's static view
+app = Flask(__name__, static_folder=None, template_folder='../templates')
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
 
+from database.config import Config
+from database.db_utils import mongodb_manager
+from utils import sentiment_analysis
+
+# Share sentiment results between gunicorn workers through MongoDB
+if Config.sentiment_cache_shared:
+    sentiment_analysis.cache.store = mongodb_manager
+
 from server.routes import register_routes
-register_routes(app)
\ No newline at end of file
+register_routes(app)
+
+from server.commands import register_commands
+register_commands(app)
+
+# Nothing above may block on the network: MongoDB, Gemini and the sentiment
+# backend are all connected lazily on first use in each worker process
+startup_ms = (time.perf_counter() - _import_started) * 1000
+if startup_ms > Config.startup_budget_ms:
+    logging.warning(f"App startup took {startup_ms:.0f} ms (budget {Config.startup_budget_ms:.0f} ms)")
+else:
+    logging.info(f"App startup took {startup_ms:.0f} ms")
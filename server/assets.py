@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+from flask import Response, abort, request
+
+# Media types worth compressing; other files (e.g. images) are served as they are
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+# Fingerprinted URLs never change content, so browsers may keep them for a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def _compressors():
+    """(encoding, compress) pairs available here; brotli is optional"""
+    compressors = [("gzip", lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    try:
+        import brotli
+    except ImportError:
+        return compressors
+    return [("br", lambda data: brotli.compress(data, quality=11))] + compressors
+
+
+class StaticAssets:
+    """Content-hashed, precompressed copies of the files in a static directory
+
+    Every file is read once into memory, named after its content hash
+    (css/main.css -> css/main.3f2a9c1b04de.css) and compressed ahead of time.
+    `url_path` maps a file to its fingerprinted name for url_for('static'),
+    and `response` serves either name: the fingerprinted one may be cached
+    forever, the plain one (kept for pages rendered before a deploy) must be
+    revalidated. With `reload`, changed files are picked up on the next use.
+    """
+
+    def __init__(self, directory, reload=False):
+        self.directory = os.path.abspath(directory)
+        self.reload = reload
+        self._compressors = _compressors()
+        self._snapshot = None
+        # (plain path -> fingerprinted path, plain or fingerprinted path -> asset),
+        # replaced as a whole so requests never see half a rebuild
+        self._manifest = ({}, {})
+        self.build()
+
+    def build(self):
+        """(Re)load every file of the directory into the manifest"""
+        paths, assets = {}, {}
+        for path, full_path in self._files():
+            with open(full_path, "rb") as f:
+                content = f.read()
+            asset = self._asset(path, content)
+            paths[path] = asset["path"]
+            assets[path] = assets[asset["path"]] = asset
+        self._snapshot = self._scan()
+        self._manifest = (paths, assets)
+        logging.info(f"Loaded {len(paths)} static assets from {self.directory}")
+
+    def url_path(self, path):
+        """Fingerprinted name of a static file, or `path` itself if there is no such file"""
+        self._maybe_reload()
+        return self._manifest[0].get(path, path)
+
+    def response(self, path):
+        """The asset at `path` in the best encoding the client accepts (404 if unknown)"""
+        self._maybe_reload()
+        asset = self._manifest[1].get(path)
+        if asset is None:
+            abort(404)
+
+        encoding = next(
+            (name for name in asset["encodings"] if request.accept_encodings[name]),
+            None
+        )
+        body = asset["encodings"][encoding] if encoding else asset["content"]
+        response = Response(body, mimetype=asset["mimetype"])
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        # Each encoding is a different representation and needs its own strong ETag
+        response.set_etag(f"{asset['hash']}-{encoding}" if encoding else asset["hash"])
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = IMMUTABLE if path == asset["path"] else "no-cache"
+        return response.make_conditional(request)
+
+    def _asset(self, path, content):
+        digest = hashlib.sha1(content).hexdigest()[:12]
+        stem, extension = os.path.splitext(path)
+        mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        encodings = {}
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            for name, compress in self._compressors:
+                compressed = compress(content)
+                if len(compressed) < len(content):
+                    encodings[name] = compressed
+        return {
+            "path": f"{stem}.{digest}{extension}",
+            "hash": digest,
+            "mimetype": mimetype,
+            "content": content,
+            "encodings": encodings
+        }
+
+    def _files(self):
+        """(URL path, file path) of every file under the directory, hidden ones excepted"""
+        for root, directories, files in os.walk(self.directory):
+            directories[:] = [name for name in directories if not name.startswith(".")]
+            for name in files:
+                if name.startswith("."):
+                    continue
+                full_path = os.path.join(root, name)
+                yield os.path.relpath(full_path, self.directory).replace(os.sep, "/"), full_path
+
+    def _scan(self):
+        return {path: os.stat(full_path).st_mtime_ns for path, full_path in self._files()}
+
+    def _maybe_reload(self):
+        if self.reload and self._scan() != self._snapshot:
+            self.build()
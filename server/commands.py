@@ -0,0 +1,211 @@
+import json
+import click
+from database.db_utils import completed_at_query, mongodb_manager
+from server.export import EXPORT_FORMATS, export_chunks
+from server.relabel import CHECKPOINT as RELABEL_CHECKPOINT, LOCK_LEASE_SECONDS as RELABEL_LOCK_LEASE, relabel_surveys
+from server.sentiment_worker import run_sentiment_worker
+from utils.question_pool import QUESTION_POOL_MAX_SERVES
+from utils.sentiment_analysis import SENTIMENT_MODEL_VERSION, analyze_surveys
+
+
+def register_commands(app):
+    """Register maintenance CLI commands with the Flask app"""
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create the MongoDB indexes the app relies on (run once per deploy)."""
+        try:
+            mongodb_manager.ensure_indexes()
+        except Exception as e:
+            raise click.ClickException(f'Failed to create indexes: {e}')
+        click.echo('MongoDB indexes are up to date')
+        # Saves only maintain counters that have been computed from the existing surveys once
+        result = mongodb_manager.seed_rollups()
+        if result is not None:
+            if not result["success"]:
+                raise click.ClickException(f'Failed to build rollups: {result.get("error", "Unknown error")}')
+            click.echo(
+                f'Built rollups from {result["surveys"]} surveys '
+                f'({result["questions"]} questions, {result["buckets"]} hourly/daily buckets)'
+            )
+
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups():
+        """Recompute the analytics rollups and time buckets from the surveys collection."""
+        result = mongodb_manager.rebuild_rollups()
+        if not result["success"]:
+            raise click.ClickException(f'Failed to rebuild rollups: {result.get("error", "Unknown error")}')
+        click.echo(
+            f'Rebuilt rollups from {result["surveys"]} surveys '
+            f'({result["questions"]} questions, {result["buckets"]} hourly/daily buckets)'
+        )
+
+    @app.cli.command('migrate-questions')
+    @click.option('--batch-size', default=500, show_default=True, help='Surveys rewritten per bulk request.')
+    def migrate_questions(batch_size):
+        """Replace full question texts in stored surveys with question catalog IDs."""
+        try:
+            result = mongodb_manager.migrate_question_ids(batch_size=batch_size)
+        except Exception as e:
+            raise click.ClickException(f'Migration stopped, rerun to continue: {e}')
+        click.echo(
+            f'Migrated {result["migrated"]} surveys ({result["skipped"]} changed meanwhile, rerun to retry);'
+            f' the catalog has {result["questions"]} questions'
+        )
+        # Fold counters still keyed by question text into their question IDs
+        ctx = click.get_current_context()
+        ctx.invoke(rebuild_rollups)
+
+    @app.cli.command('rebuild-search-index')
+    @click.option('--batch-size', default=1000, show_default=True, help='Surveys indexed per bulk request.')
+    def rebuild_search_index(batch_size):
+        """Re-create the answer search index (kept up to date on every write) from the surveys collection."""
+        try:
+            result = mongodb_manager.rebuild_answer_index(batch_size=batch_size)
+        except Exception as e:
+            raise click.ClickException(f'Failed to rebuild the search index: {e}')
+        click.echo(f'Indexed {result["answers"]} answers from {result["surveys"]} surveys')
+
+    @app.cli.command('sentiment-worker')
+    @click.option('--batch-size', default=50, show_default=True, help='Surveys claimed per batch.')
+    @click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+    @click.option('--timeout', default=60.0, show_default=True, help='Seconds allowed to classify one batch.')
+    @click.option('--once', is_flag=True, help='Exit once the queue is empty.')
+    @click.option('--requeue', is_flag=True, help='First queue PENDING surveys that have no job.')
+    def sentiment_worker(batch_size, poll_interval, timeout, once, requeue):
+        """Label PENDING survey answers queued by SENTIMENT_MODE=async."""
+        if requeue:
+            click.echo(f'Queued {mongodb_manager.requeue_pending_surveys()} surveys')
+        run_sentiment_worker(batch_size=batch_size, poll_interval=poll_interval, timeout=timeout, once=once)
+
+    @app.cli.command('export-surveys')
+    @click.argument('output', type=click.Path(dir_okay=False, allow_dash=True), default='-')
+    @click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+    @click.option('--from', 'start', help='Only surveys completed at or after this ISO 8601 date.')
+    @click.option('--to', 'end', help='Only surveys completed before this ISO 8601 date.')
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the CSV (Parquet: gzip column compression).')
+    @click.option('--batch-size', default=500, show_default=True, help='Surveys fetched per cursor batch.')
+    def export_surveys(output, export_format, start, end, compress, batch_size):
+        """Write one row per survey response to OUTPUT ('-' for stdout) as CSV or Parquet."""
+        try:
+            query = completed_at_query(start, end)
+            chunks = export_chunks(export_format, query, compress=compress, batch_size=batch_size)
+        except (ValueError, RuntimeError) as e:
+            raise click.ClickException(str(e))
+        
+        written = 0
+        with click.open_file(output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+        click.echo(f'Exported {written} bytes', err=True)
+
+    @app.cli.command('relabel-sentiment')
+    @click.option('--batch-size', default=500, show_default=True, help='Surveys read and written per batch (and per checkpoint).')
+    @click.option('--chunk-size', default=100, show_default=True, help='Distinct answers per classification call.')
+    @click.option('--concurrency', default=4, show_default=True, help='Classification calls in flight at once.')
+    @click.option('--timeout', default=120.0, show_default=True, help='Seconds allowed for one classification call.')
+    @click.option('--all', 'relabel_all', is_flag=True, help='Re-classify every answer, not only those from other model versions.')
+    @click.option('--restart', is_flag=True, help='Ignore a saved checkpoint and start from the newest survey.')
+    @click.option('--dry-run', is_flag=True, help='Classify and report, but write nothing.')
+    @click.option('--force', is_flag=True, help='Take over the lock of a run that was killed before its lease ran out.')
+    def relabel_sentiment(batch_size, chunk_size, concurrency, timeout, relabel_all, restart, dry_run, force):
+        """Backfill sentiment labels with the current SENTIMENT_MODEL_VERSION, resuming an interrupted run."""
+        token = mongodb_manager.acquire_lock(RELABEL_CHECKPOINT, RELABEL_LOCK_LEASE, force=force)
+        if token is None:
+            raise click.ClickException('Another relabel-sentiment run is in progress (--force if it was killed)')
+        
+        def progress(stats):
+            if not mongodb_manager.renew_lock(RELABEL_CHECKPOINT, token, RELABEL_LOCK_LEASE):
+                raise Exception('another run took over the lock')
+            click.echo(f'Relabelled {stats["answers"]} answers in {stats["surveys"]} surveys...', err=True)
+        
+        try:
+            stats = relabel_surveys(
+                batch_size=batch_size, chunk_size=chunk_size, concurrency=concurrency, timeout=timeout,
+                relabel_all=relabel_all, restart=restart, dry_run=dry_run, progress=progress
+            )
+        except Exception as e:
+            raise click.ClickException(f'Relabelling stopped, rerun to resume: {e}')
+        finally:
+            mongodb_manager.release_lock(RELABEL_CHECKPOINT, token)
+        resumed = ' (resumed)' if stats["resumed"] else ''
+        click.echo(
+            f'{"Would relabel" if dry_run else "Relabelled"} {stats["answers"]} answers in {stats["surveys"]} surveys'
+            f' with {SENTIMENT_MODEL_VERSION}{resumed}: {stats["classified"]} distinct texts classified,'
+            f' {stats["changed"]} labels changed, {stats["skipped"]} surveys skipped because they changed meanwhile'
+        )
+
+    @app.cli.command('refill-questions')
+    def refill_questions():
+        """Top the pre-generated question pool up to its high watermark."""
+        question_pool = app.extensions['question_pool']
+        question_pool.refill()
+        question_pool.wait_for_refill()
+        click.echo(f'Question pool has {mongodb_manager.count_pool_questions(QUESTION_POOL_MAX_SERVES)} servable questions')
+
+    @app.cli.command('import-surveys')
+    @click.argument('path', type=click.File('r', encoding='utf-8'))
+    @click.option('--batch-size', default=500, show_default=True, help='Surveys written per bulk request.')
+    @click.option('--relabel', is_flag=True, help='Re-classify answers that already carry a sentiment label.')
+    @click.option('--defer-sentiment', is_flag=True, help='Store answers PENDING and queue them for the sentiment worker.')
+    @click.option('--chunk-size', default=100, show_default=True, help='Answers per classification call.')
+    @click.option('--timeout', default=120.0, show_default=True, help='Seconds allowed for one classification call.')
+    def import_surveys(path, batch_size, relabel, defer_sentiment, chunk_size, timeout):
+        """Bulk load surveys from a JSON Lines file (one survey per line, '-' for stdin)."""
+        saved = 0
+        pending = 0
+        errors = []
+        batch = []
+        
+        def flush():
+            nonlocal saved, pending
+            # A surveyId repeated within the batch is stored (and classified) once, in its last version
+            jobs = analyze_surveys(
+                list({survey["surveyId"]: survey for _, survey in batch}.values()),
+                defer=defer_sentiment,
+                only_missing=not relabel,
+                chunk_size=chunk_size,
+                timeout=timeout
+            )
+            result = mongodb_manager.save_surveys([survey for _, survey in batch], chunk_size=batch_size)
+            
+            failed = set()
+            for error in result["errors"]:
+                failed.add(error["surveyId"])
+                errors.append((batch[error["index"]][0], error["error"]))
+            jobs = {survey_id: items for survey_id, items in jobs.items() if survey_id not in failed}
+            mongodb_manager.enqueue_sentiment_jobs(jobs)
+            
+            saved += result["saved"]
+            pending += sum(len(items) for items in jobs.values())
+            batch.clear()
+            click.echo(f'Imported {saved} surveys...', err=True)
+        
+        for line_number, line in enumerate(path, 1):
+            if not line.strip():
+                continue
+            try:
+                survey = json.loads(line)
+            except ValueError as e:
+                errors.append((line_number, f'Invalid JSON: {e}'))
+                continue
+            if not isinstance(survey, dict):
+                errors.append((line_number, 'Expected a JSON object'))
+                continue
+            if not survey.get('surveyId'):
+                errors.append((line_number, 'Missing surveyId'))
+                continue
+            batch.append((line_number, survey))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+        
+        for line_number, error in errors[:20]:
+            click.echo(f'  line {line_number}: {error}', err=True)
+        if len(errors) > 20:
+            click.echo(f'  ... and {len(errors) - 20} more errors', err=True)
+        click.echo(f'Imported {saved} surveys ({len(errors)} errors, {pending} answers queued for sentiment)')
+        if errors and not saved:
+            raise click.ClickException('No surveys were imported')
@@ -0,0 +1,155 @@
+import csv
+import io
+import zlib
+from database.db_utils import mongodb_manager
+
+# One row per response
+EXPORT_COLUMNS = (
+    "surveyId", "startedAt", "completedAt", "questionNumber", "questionId",
+    "question", "answer", "sentiment", "sentimentModel"
+)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+# Rows encoded per CSV chunk / per Parquet row group
+CSV_CHUNK_ROWS = 1000
+PARQUET_ROW_GROUP_ROWS = 50000
+
+
+def flatten_survey(survey):
+    """Export rows (tuples in EXPORT_COLUMNS order) of one survey's responses"""
+    for response in survey.get("responses") or []:
+        sentiment = response.get("SentiAnalysis") or {}
+        question_number = response.get("questionNumber")
+        yield (
+            survey.get("surveyId"),
+            survey.get("startedAt"),
+            survey.get("completedAt"),
+            question_number if isinstance(question_number, int) else None,
+            response.get("questionId"),
+            response.get("question"),
+            response.get("answer"),
+            sentiment.get("label"),
+            sentiment.get("model"),
+        )
+
+
+def iter_rows(query, batch_size=500):
+    """Flattened rows of every matching survey, newest first, from a server-side cursor"""
+    surveys = mongodb_manager.iter_surveys(
+        query=query,
+        batch_size=batch_size,
+        projection={"surveyId": 1, "startedAt": 1, "completedAt": 1, "responses": 1}
+    )
+    for survey in surveys:
+        yield from flatten_survey(survey)
+
+
+def csv_chunks(rows, chunk_rows=CSV_CHUNK_ROWS):
+    """UTF-8 CSV (with a header row) encoded `chunk_rows` rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= chunk_rows:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of byte chunks incrementally"""
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out whatever has been written since the last drain"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_chunks(rows, compression="snappy", row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    """Parquet file bytes, written one row group of `row_group_rows` rows at a time
+
+    pyarrow is imported here, before any output, so a missing install fails
+    the request instead of truncating the download.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires: pip install pyarrow")
+    return _write_parquet(pa, pq, rows, compression, row_group_rows)
+
+
+def _write_parquet(pa, pq, rows, compression, row_group_rows):
+    schema = pa.schema([
+        (column, pa.int64() if column == "questionNumber" else pa.string())
+        for column in EXPORT_COLUMNS
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= row_group_rows:
+                writer.write_table(pa.Table.from_arrays(list(map(list, zip(*batch))), schema=schema))
+                batch = []
+                yield sink.drain()
+        if batch:
+            writer.write_table(pa.Table.from_arrays(list(map(list, zip(*batch))), schema=schema))
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_chunks(export_format, query, compress=False, batch_size=500):
+    """Byte chunks of a survey export; memory use does not grow with its size
+
+    CSV is gzipped as a whole with `compress`; Parquet compresses its columns
+    with gzip instead of snappy.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+    rows = iter_rows(query, batch_size=batch_size)
+    if export_format == "parquet":
+        return parquet_chunks(rows, compression="gzip" if compress else "snappy")
+    chunks = csv_chunks(rows)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_filename(export_format, compress=False, stamp=""):
+    extension = EXPORT_FORMATS[export_format][1]
+    if compress and export_format == "csv":
+        extension += ".gz"
+    return f"surveys{'-' + stamp if stamp else ''}.{extension}"
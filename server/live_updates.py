@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from pymongo.errors import OperationFailure
+from utils.metrics import LIVE_DASHBOARDS, LIVE_EVENTS
+
+# Server error code for "$changeStream is only supported on replica sets"
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+class LiveUpdates:
+    """Pushes analytics counter deltas to connected dashboards as Server-Sent Events
+
+    `store` is a MongoDBManager: `publish` is registered as one of its rollup
+    listeners, so every committed survey write is fanned out to this worker's
+    dashboards straight away. With `shared`, deltas are also written to MongoDB
+    and a single relay thread per worker follows them with a change stream to
+    reach dashboards connected to other workers. Deltas are only written while
+    another worker announces connected dashboards (checked at most once per
+    `heartbeat`), and only if the server supports change streams (checked once
+    per worker); without a replica set each worker delivers its own deltas
+    only. Dashboards notice the gaps in the data version and re-fetch
+    /api/analytics/data.
+
+    Idle connections cost one blocked thread (or greenlet) and a keep-alive
+    comment every `heartbeat` seconds, so at most `max_streams` are open per
+    worker; connect() refuses further ones.
+    """
+
+    def __init__(self, store, shared=True, heartbeat=15.0, max_queue=100, max_streams=100):
+        self.store = store
+        self.shared = shared
+        self.heartbeat = heartbeat
+        self.max_queue = max_queue
+        self.max_streams = max_streams
+        self.origin = uuid.uuid4().hex
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._relay_thread = None
+        # None until the server has been asked whether it supports change streams
+        self._change_streams = None
+        # Whether other workers have dashboards, and when that was last checked / announced
+        self._dashboards_elsewhere = False
+        self._checked_at = 0.0
+        self._announced_at = 0.0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # Neither the relay thread nor the parent's connections exist in the child
+        self.origin = uuid.uuid4().hex
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._relay_thread = None
+        self._dashboards_elsewhere = False
+        self._checked_at = 0.0
+        self._announced_at = 0.0
+
+    def publish(self, delta):
+        """Rollup listener: deliver a delta locally and share it with the other workers"""
+        with self._lock:
+            local = bool(self._subscribers)
+        share = self._share()
+        if not local and not share:
+            # Nobody is watching; skip the catalog lookup and the event write
+            return
+
+        texts = self.store.question_texts(delta["questions"])
+        event = {
+            "version": delta["version"],
+            "totals": delta["totals"],
+            "questions": [
+                {"questionId": qid, "question": texts[qid], **counts}
+                for qid, counts in delta["questions"].items()
+            ]
+        }
+        self._fan_out(event)
+        LIVE_EVENTS.labels(event='published').inc()
+
+        if share:
+            try:
+                self.store.add_analytics_event({**event, "origin": self.origin})
+            except Exception as e:
+                logging.error(f"Error sharing analytics delta: {e}")
+
+    def connect(self):
+        """Subscribe a dashboard connection; None if this worker already streams to max_streams"""
+        return self._subscribe()
+
+    def disconnect(self, subscriber):
+        """Unsubscribe a connection; safe to call more than once"""
+        self._unsubscribe(subscriber)
+
+    def stream(self, subscriber):
+        """Server-Sent Events for one connect()ed dashboard, until it disconnects"""
+        try:
+            # Browsers reconnect after this many ms if the connection drops
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = subscriber.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    self._announce()
+                    yield ": keep-alive\n\n"
+                    continue
+                self._announce()
+                if event is None:
+                    # Fell too far behind; the dashboard reloads the full counters
+                    yield "event: resync\ndata: {}\n\n"
+                    continue
+                yield f"id: {event['version']}\nevent: delta\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self._unsubscribe(subscriber)
+
+    def _share(self):
+        """Whether deltas should be written for dashboards connected to other workers"""
+        if not self._change_streams_supported():
+            return False
+        now = time.monotonic()
+        if now - self._checked_at >= self.heartbeat:
+            self._checked_at = now
+            try:
+                self._dashboards_elsewhere = self.store.live_dashboards_elsewhere(self.origin)
+            except Exception as e:
+                logging.error(f"Error checking for live dashboards: {e}")
+        return self._dashboards_elsewhere
+
+    def _change_streams_supported(self):
+        if not self.shared:
+            return False
+        if self._change_streams is None:
+            try:
+                self._change_streams = self.store.supports_change_streams()
+            except Exception as e:
+                # Ask again next time
+                logging.error(f"Error checking MongoDB change stream support: {e}")
+                return False
+            if not self._change_streams:
+                logging.warning("MongoDB change streams unavailable, live updates stay within each worker")
+                self.shared = False
+        return self._change_streams
+
+    def _announce(self, force=False):
+        """Tell the other workers this one has dashboards, so they share their deltas"""
+        now = time.monotonic()
+        if not force and now - self._announced_at < self.heartbeat:
+            return
+        if not self._change_streams_supported():
+            return
+        self._announced_at = now
+        try:
+            # Outlives a missed keep-alive or two; a killed worker's entry expires on its own
+            self.store.announce_live_dashboards(self.origin, 3 * self.heartbeat)
+        except Exception as e:
+            logging.error(f"Error announcing live dashboards: {e}")
+
+    def _subscribe(self):
+        subscriber = queue.Queue(maxsize=self.max_queue)
+        with self._lock:
+            if len(self._subscribers) >= self.max_streams:
+                LIVE_EVENTS.labels(event='refused').inc()
+                return None
+            self._subscribers.add(subscriber)
+            if self.shared and self._relay_thread is None:
+                self._relay_thread = threading.Thread(
+                    target=self._relay, name="analytics-relay", daemon=True
+                )
+                self._relay_thread.start()
+        self._announce(force=True)
+        LIVE_DASHBOARDS.inc()
+        return subscriber
+
+    def _unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber not in self._subscribers:
+                return
+            self._subscribers.discard(subscriber)
+            last = not self._subscribers
+        LIVE_DASHBOARDS.dec()
+        if last and self.shared and self._change_streams:
+            self._announced_at = 0.0
+            try:
+                self.store.withdraw_live_dashboards(self.origin)
+            except Exception as e:
+                logging.error(f"Error withdrawing live dashboards: {e}")
+
+    def _fan_out(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Replace the backlog of a stalled dashboard with a single resync marker
+                LIVE_EVENTS.labels(event='dropped').inc()
+                while True:
+                    try:
+                        subscriber.get_nowait()
+                    except queue.Empty:
+                        break
+                subscriber.put_nowait(None)
+
+    def _relay(self):
+        """Deliver deltas written by other workers; runs for the life of the worker"""
+        delay = 1
+        while True:
+            try:
+                for event in self.store.watch_analytics_events():
+                    delay = 1
+                    if event.get("origin") == self.origin:
+                        continue
+                    self._fan_out({key: event[key] for key in ("version", "totals", "questions")})
+                    LIVE_EVENTS.labels(event='relayed').inc()
+            except (OperationFailure, NotImplementedError) as e:
+                if isinstance(e, NotImplementedError) or e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logging.warning(f"MongoDB change streams unavailable, live updates stay within each worker: {e}")
+                    self.shared = False
+                    return
+                logging.error(f"Analytics change stream failed: {e}")
+            except Exception as e:
+                logging.error(f"Analytics change stream failed: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
@@ -0,0 +1,121 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from database.db_utils import mongodb_manager
+from utils.sentiment_analysis import PENDING, SENTIMENT_MODEL_VERSION, get_sentiments
+
+CHECKPOINT = "relabel-sentiment"
+STATS = ("surveys", "answers", "classified", "changed", "skipped")
+# The run's lock is renewed after every batch, so a killed run only blocks
+# the next one for this long
+LOCK_LEASE_SECONDS = 15 * 60
+
+
+def stale_query(model, relabel_all=False):
+    """Surveys with at least one answer not labelled by `model` (PENDING answers belong to the worker)"""
+    condition = {
+        "answer": {"$nin": ["", None]},
+        "SentiAnalysis.label": {"$ne": PENDING}
+    }
+    if not relabel_all:
+        condition["SentiAnalysis.model"] = {"$ne": model}
+    return {"responses": {"$elemMatch": condition}}
+
+
+def stale_answers(survey, model, relabel_all=False):
+    """(index, answer, old_label) of a survey's answers that need a new label"""
+    answers = []
+    for index, response in enumerate(survey.get("responses") or []):
+        sentiment = response.get("SentiAnalysis") or {}
+        answer = response.get("answer") or ""
+        if not answer.strip() or sentiment.get("label") == PENDING:
+            continue
+        if relabel_all or sentiment.get("model") != model:
+            answers.append((index, answer, sentiment.get("label")))
+    return answers
+
+
+def classify_unique(texts, chunk_size, concurrency, timeout, use_cache=True):
+    """{text: label} for distinct texts, classified in concurrent chunks"""
+    unique = list(dict.fromkeys(texts))
+    chunks = [unique[start:start + chunk_size] for start in range(0, len(unique), chunk_size)]
+    labels = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        classify = lambda chunk: get_sentiments(chunk, timeout=timeout, use_cache=use_cache)
+        for chunk, results in zip(chunks, executor.map(classify, chunks)):
+            labels.update((text, result["label"]) for text, result in zip(chunk, results))
+    return labels
+
+
+def relabel_surveys(batch_size=500, chunk_size=100, concurrency=4, timeout=120,
+                    relabel_all=False, restart=False, dry_run=False, progress=None):
+    """Re-classify stored answers with the current sentiment model, resumably
+
+    Surveys are streamed newest first in `batch_size` batches. Each batch's
+    distinct answer texts are classified in `chunk_size` chunks, `concurrency`
+    at a time, and the labels are written back with one bulk write. After
+    every batch the cursor position is checkpointed, so an interrupted run
+    resumes where it stopped (unless `restart`, or the model version changed).
+    """
+    model = SENTIMENT_MODEL_VERSION
+    checkpoint = None if restart else mongodb_manager.get_checkpoint(CHECKPOINT)
+    if checkpoint and (checkpoint.get("model") != model or checkpoint.get("relabelAll") != relabel_all):
+        checkpoint = None
+
+    stats = {key: (checkpoint or {}).get(key, 0) for key in STATS}
+    after = tuple(checkpoint["after"]) if checkpoint and checkpoint.get("after") else None
+
+    batch = []
+    surveys = mongodb_manager.iter_surveys(
+        query=stale_query(model, relabel_all),
+        after=after,
+        batch_size=batch_size,
+        projection={"surveyId": 1, "completedAt": 1, "responses": 1}
+    )
+    for survey in surveys:
+        batch.append(survey)
+        if len(batch) >= batch_size:
+            _relabel_batch(batch, model, stats, chunk_size, concurrency, timeout, relabel_all, dry_run)
+            after = (batch[-1].get("completedAt"), batch[-1]["surveyId"])
+            if not dry_run:
+                mongodb_manager.save_checkpoint(CHECKPOINT, {
+                    "model": model, "relabelAll": relabel_all, "after": list(after), **stats
+                })
+            batch = []
+            if progress:
+                progress(stats)
+    if batch:
+        _relabel_batch(batch, model, stats, chunk_size, concurrency, timeout, relabel_all, dry_run)
+        if progress:
+            progress(stats)
+
+    if not dry_run:
+        mongodb_manager.delete_checkpoint(CHECKPOINT)
+        if stats["skipped"]:
+            # Some surveys changed while being relabelled; their counter deltas were still applied
+            logging.warning(f"{stats['skipped']} surveys changed during relabelling, rebuilding rollups")
+            mongodb_manager.rebuild_rollups()
+    stats["resumed"] = checkpoint is not None
+    return stats
+
+
+def _relabel_batch(batch, model, stats, chunk_size, concurrency, timeout, relabel_all, dry_run):
+    work = [(survey, stale_answers(survey, model, relabel_all)) for survey in batch]
+    work = [(survey, answers) for survey, answers in work if answers]
+    texts = [answer for _, answers in work for _, answer, _ in answers]
+
+    # --all re-classifies, so labels cached from the same model must not be reused
+    labels = classify_unique(texts, chunk_size, concurrency, timeout, use_cache=not relabel_all)
+    changes = [
+        (survey, [(index, old_label, labels[answer]) for index, answer, old_label in answers])
+        for survey, answers in work
+    ]
+
+    stats["surveys"] += len(batch)
+    stats["answers"] += len(texts)
+    stats["classified"] += len(labels)
+    stats["changed"] += sum(
+        1 for _, answers in changes for _, old_label, new_label in answers if old_label != new_label
+    )
+    if not dry_run:
+        result = mongodb_manager.relabel_answers(changes, model)
+        stats["skipped"] += result["expected"] - result["matched"]
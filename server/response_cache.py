@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import Response, make_response, request
+from utils.metrics import RESPONSE_CACHE_EVENTS
+
+# Directories whose Python sources make up a release (see source_release)
+SOURCE_DIRECTORIES = ("server", "database", "utils")
+
+
+def source_release(root=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))):
+    """Short hash of the application's Python sources, standing in for a release number"""
+    paths = []
+    for directory in SOURCE_DIRECTORIES:
+        for path, directories, files in os.walk(os.path.join(root, directory)):
+            directories[:] = [name for name in directories if not name.startswith((".", "__"))]
+            paths.extend(os.path.join(path, name) for name in files if name.endswith(".py"))
+
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        digest.update(os.path.relpath(path, root).replace(os.sep, "/").encode("utf-8"))
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class ResponseCache:
+    """Caches rendered JSON responses per survey data version
+
+    `store` is any object with `get_data_version(max_age)` and, when `shared`,
+    `get_cached_response(name, version)` / `cache_response(name, version, body)`
+    (MongoDBManager provides them). The ETag is derived from the key and version alone,
+    so a conditional request for a key this worker has rendered is answered with
+    304 from its copy of the version without rendering, or reading, anything
+    else; other keys are validated by the view first. `release` (e.g. a
+    git commit) is part of every cache key and ETag: bodies rendered by other
+    code are neither served nor confirmed after a deploy.
+    """
+
+    def __init__(self, store, version_ttl=1.0, shared=True, max_entries=256, release=""):
+        self.store = store
+        self.release = release
+        self.version_ttl = version_ttl
+        self.shared = shared
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"not_modified": 0, "memory_hits": 0, "store_hits": 0, "misses": 0}
+        os.register_at_fork(after_in_child=self.after_fork)
+
+    def etag(self, key, version):
+        return f"{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}-v{version}"
+
+    def key(self, name, args, params=()):
+        """Cache key of a view's response to the query `args`, within this release
+
+        Only `params` select the response; any other argument is ignored, so
+        arbitrary query strings cannot grow the cache.
+        """
+        key = f"{self.release}:{name}" if self.release else name
+        selected = sorted((k, v) for k, v in args.items(multi=True) if k in params)
+        if selected:
+            # Each distinct query (e.g. a date range) is cached separately
+            key = f"{key}?" + "&".join(f"{k}={v}" for k, v in selected)
+        return key
+
+    def cached(self, name, params=()):
+        """Decorator serving a JSON view from the cache with conditional GET support
+
+        `params` are the query arguments the view's response depends on.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                key = self.key(name, request.args, params)
+                try:
+                    version = self.store.get_data_version(max_age=self.version_ttl)
+                except Exception as e:
+                    logging.error(f"Error reading data version, serving {key} uncached: {e}")
+                    return view(*args, **kwargs)
+
+                etag = self.etag(key, version)
+                not_modified = request.if_none_match.contains(etag)
+                # A key rendered before has valid arguments; others are confirmed below
+                if not_modified and self._rendered(key):
+                    self._count("not_modified")
+                    return self._respond(Response(status=304), etag)
+
+                body = self._get(key, version)
+                if body is None:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    body = response.get_data()
+                    self._set(key, version, body)
+
+                if not_modified:
+                    self._count("not_modified")
+                    return self._respond(Response(status=304), etag)
+                return self._respond(Response(body, mimetype='application/json'), etag)
+            return wrapper
+        return decorator
+
+    def after_fork(self):
+        """Replace the lock, which may have been held by another thread at fork time"""
+        self._lock = threading.Lock()
+
+    def _respond(self, response, etag):
+        response.set_etag(etag)
+        # Browsers revalidate on every poll instead of reusing a stale copy
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def _rendered(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def _get(self, name, version):
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is not None and entry[0] == version:
+            self._count("memory_hits")
+            return entry[1]
+
+        if self.shared:
+            try:
+                body = self.store.get_cached_response(name, version)
+            except Exception as e:
+                logging.error(f"Error reading response cache store: {e}")
+                body = None
+            if body is not None:
+                self._remember(name, version, body)
+                self._count("store_hits")
+                return body
+
+        self._count("misses")
+        return None
+
+    def _set(self, name, version, body):
+        self._remember(name, version, body)
+        if self.shared:
+            try:
+                self.store.cache_response(name, version, body)
+            except Exception as e:
+                logging.error(f"Error writing response cache store: {e}")
+
+    def _remember(self, name, version, body):
+        with self._lock:
+            current = self._entries.get(name)
+            if current is None or current[0] <= version:
+                self._entries[name] = (version, body)
+                self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+        RESPONSE_CACHE_EVENTS.labels(event=stat).inc()
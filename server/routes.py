@@ -1,79 +1,324 @@
-from flask import jsonify, send_from_directory, request, render_template
+from flask import g, jsonify, request, render_template, Response, stream_with_context
 from utils.qa_gen import generate
-from utils.sentiment_analysis import get_sentiment
-from database.db_utils import mongodb_manager
+from utils.question_pool import QuestionPool
+from utils.sentiment_analysis import analyze_surveys, label_responses, mark_responses_pending, cache as sentiment_cache
+from database.config import Config
+from database.db_utils import SENTIMENT_KEYS, bucket_key, completed_at_query, mongodb_manager, parse_timestamp
+from utils.questions import question_id
+from utils import fast_json
+from server.assets import StaticAssets
+from server.export import EXPORT_FORMATS, export_chunks, export_filename
+from server.live_updates import LiveUpdates
+from server.response_cache import ResponseCache, source_release
+from utils.metrics import HTTP_REQUEST_SECONDS, ROUTE_STAGE_SECONDS, render as render_metrics
+import base64
+import json
 import os
 import logging
+import time
+from datetime import datetime, timedelta, timezone
 
 logging.basicConfig(level=logging.INFO)
 
+SURVEYS_PAGE_SIZE = 20
+SURVEYS_MAX_PAGE_SIZE = 100
+SURVEYS_STREAM_BATCH_SIZE = 500
+SENTIMENT_LABELS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL', 'PENDING')
+# Largest batch accepted by /api/save-surveys
+BULK_SAVE_MAX = 1000
+# Seconds a dashboard refused a live stream waits before asking again (see analytics.js)
+LIVE_STREAM_RETRY_AFTER = 30
+
+# Analytics range granularity -> (bucket size read from MongoDB, default span)
+ANALYTICS_GRANULARITIES = {
+    'hour': ('hour', timedelta(days=1)),
+    'day': ('day', timedelta(days=30)),
+    'week': ('day', timedelta(weeks=26)),
+    'month': ('day', timedelta(days=365)),
+}
+# Length of the buckets each source holds
+BUCKET_SIZES = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+# Longest range answered from hourly buckets
+ANALYTICS_MAX_HOURLY_RANGE = timedelta(days=31)
+# /api/analytics/data?format=...; bump COMPACT_ANALYTICS_VERSION on any change to its layout
+ANALYTICS_FORMATS = ('full', 'compact')
+COMPACT_ANALYTICS_VERSION = 1
+
+
+def encode_cursor(key):
+    """Encode a keyset position, e.g. (completedAt, surveyId), as an opaque token"""
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def decode_cursor(token):
+    """Decode a token produced by encode_cursor; raises ValueError if malformed"""
+    try:
+        completed_at, survey_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    return completed_at, survey_id
+
+def parse_date_range(args):
+    """(granularity, from, to) requested through query parameters, or None for all-time
+
+    `to` defaults to now and `from` to a span suited to the granularity.
+    Raises ValueError for malformed or oversized ranges.
+    """
+    if not any(args.get(name) for name in ('from', 'to', 'granularity')):
+        return None
+    
+    granularity = args.get('granularity', 'day')
+    if granularity not in ANALYTICS_GRANULARITIES:
+        raise ValueError(f'granularity must be one of: {", ".join(ANALYTICS_GRANULARITIES)}')
+    
+    end = parse_timestamp(args['to']) if args.get('to') else datetime.now(timezone.utc)
+    start = parse_timestamp(args['from']) if args.get('from') else end - ANALYTICS_GRANULARITIES[granularity][1]
+    if start is None or end is None:
+        raise ValueError('from/to must be ISO 8601 dates')
+    if start >= end:
+        raise ValueError('from must be before to')
+    if granularity == 'hour' and end - start > ANALYTICS_MAX_HOURLY_RANGE:
+        raise ValueError(f'Hourly ranges are limited to {ANALYTICS_MAX_HOURLY_RANGE.days} days')
+    return granularity, start, end
+
+
+def period_key(start, granularity):
+    """Reporting period (hour, day, ISO week start or month) of an hour/day bucket key"""
+    if granularity == 'week':
+        day = datetime.strptime(start, '%Y-%m-%d').date()
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if granularity == 'month':
+        return start[:7]
+    return start
+
+
+def period_offsets(labels, granularity):
+    """(Unix start time of the first period, offset of every period from it in granularity units)
+
+    `labels` are ascending period_key() labels.
+    """
+    if not labels:
+        return None, []
+    formats = {7: '%Y-%m', 10: '%Y-%m-%d', 13: '%Y-%m-%dT%H'}
+    starts = [datetime.strptime(label, formats[len(label)]).replace(tzinfo=timezone.utc) for label in labels]
+    first = starts[0]
+    if granularity == 'month':
+        offsets = [(start.year - first.year) * 12 + start.month - first.month for start in starts]
+    else:
+        unit = {'hour': 3600, 'day': 86400, 'week': 7 * 86400}[granularity]
+        offsets = [int((start - first).total_seconds()) // unit for start in starts]
+    return int(first.timestamp()), offsets
+
+
+def compact_analytics(rollups, data_version):
+    """Analytics counters as parallel arrays instead of nested objects
+
+    Questions are listed once (`ids`/`texts`) and sentiment labels once
+    (`labels`); every count array lines up with them. `sentiment[i][j]` is the
+    count of label i for question (or period) j. Timeline periods are given
+    as offsets, in hours, days, weeks or months, from the `start` of the
+    first one.
+    """
+    questions = rollups["questions"]
+    totals = rollups["totals"]
+    payload = {
+        'format': 'compact',
+        'formatVersion': COMPACT_ANALYTICS_VERSION,
+        'dataVersion': data_version,
+        'labels': list(SENTIMENT_KEYS),
+        'totals': {
+            'surveys': totals['surveys'],
+            'answers': totals['answers'],
+            'sentiment': [totals[key] for key in SENTIMENT_KEYS]
+        },
+        # Ordered by answer count, as in the full format
+        'questions': {
+            'ids': [rollup['questionId'] for rollup in questions],
+            'texts': [rollup['question'] for rollup in questions],
+            'totals': [rollup['total'] for rollup in questions],
+            'sentiment': [[rollup[key] for rollup in questions] for key in SENTIMENT_KEYS]
+        }
+    }
+    if 'timeline' in rollups:
+        timeline = rollups['timeline']
+        start, offsets = period_offsets(timeline['labels'], timeline['granularity'])
+        payload['timeline'] = {
+            'granularity': timeline['granularity'],
+            'from': timeline['from'],
+            'to': timeline['to'],
+            'start': start,
+            'periods': offsets,
+            'surveys': timeline['surveys'],
+            'sentiment': [timeline[key] for key in SENTIMENT_KEYS]
+        }
+    return payload
+
+
+def range_rollups(granularity, start, end):
+    """Rollups for a date range summed from the time buckets, plus a per-period timeline
+
+    Bucket boundaries apply: `start` rounds down and the exclusive `end` up
+    to the hour (granularity=hour) or day, so the bucket holding `end` (e.g.
+    the current hour or day when `to` defaults to now) is included.
+    """
+    source = ANALYTICS_GRANULARITIES[granularity][0]
+    end_key = bucket_key(end, source)
+    if bucket_key(end - timedelta(microseconds=1), source) == end_key:
+        # `end` lies inside its bucket rather than at its start
+        end_key = bucket_key(end + BUCKET_SIZES[source], source)
+    result = mongodb_manager.get_analytics_buckets(
+        source,
+        start=bucket_key(start, source),
+        end=end_key
+    )
+    if not result["success"]:
+        return result
+    
+    totals = dict.fromkeys(('surveys', 'answers') + SENTIMENT_KEYS, 0)
+    questions = {}
+    periods = {}
+    for bucket in result["buckets"]:
+        period = periods.setdefault(
+            period_key(bucket["start"], granularity),
+            dict.fromkeys(('surveys',) + SENTIMENT_KEYS, 0)
+        )
+        for key, value in bucket["totals"].items():
+            totals[key] += value
+            if key in period:
+                period[key] += value
+        for counts in bucket["questions"]:
+            merged = questions.setdefault(
+                counts["questionId"],
+                {"questionId": counts["questionId"], "question": counts["question"],
+                 **dict.fromkeys(SENTIMENT_KEYS + ('total',), 0)}
+            )
+            for key in SENTIMENT_KEYS + ('total',):
+                merged[key] += counts[key]
+    
+    return {
+        "success": True,
+        "source": "buckets",
+        "totals": totals,
+        "questions": sorted(
+            (counts for counts in questions.values() if counts["total"] > 0),
+            key=lambda counts: (-counts["total"], counts["question"])
+        ),
+        "timeline": {
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "labels": list(periods),
+            **{key: [period[key] for period in periods.values()] for key in ('surveys',) + SENTIMENT_KEYS}
+        }
+    }
+
+
 def register_routes(app):
     """Register all routes with the Flask app"""
     
+    question_pool = QuestionPool(mongodb_manager, generate)
+    app.extensions['question_pool'] = question_pool
+    # Analytics responses are re-rendered only after a survey write bumps the data version
+    analytics_cache = ResponseCache(
+        mongodb_manager,
+        version_ttl=Config.analytics_cache_version_ttl,
+        shared=Config.analytics_cache_shared,
+        release=Config.app_release or source_release()
+    )
+    app.extensions['analytics_cache'] = analytics_cache
+    # Counter deltas of every survey write, pushed to open dashboards
+    live_updates = LiveUpdates(
+        mongodb_manager,
+        shared=Config.live_updates_shared,
+        heartbeat=Config.live_updates_heartbeat,
+        max_streams=Config.live_updates_max_streams
+    )
+    mongodb_manager.rollup_listeners.append(live_updates.publish)
+    app.extensions['live_updates'] = live_updates
+    # Fingerprinted, precompressed copies of static/, built once per process
+    static_assets = StaticAssets(
+        os.path.join(app.root_path, '..', 'static'),
+        reload=app.debug
+    )
+    app.extensions['static_assets'] = static_assets
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        # url_for('static', filename='js/survey.js') -> /static/js/survey.<hash>.js
+        if endpoint == 'static' and 'filename' in values:
+            values['filename'] = static_assets.url_path(values['filename'])
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_latency(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            # The URL rule, not the raw path, keeps the label set bounded
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            HTTP_REQUEST_SECONDS.labels(
+                method=request.method,
+                route=route,
+                status=response.status_code
+            ).observe(time.perf_counter() - started)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus metrics of every worker process"""
+        body, content_type = render_metrics()
+        return Response(body, content_type=content_type)
+    
     @app.route('/api/save-survey', methods=['POST'])
     def save_survey():
         try:
             survey_data = request.get_json()
             
-            # Sentiment analysis on each response
-            answers = []
-            for response in survey_data.get('responses', []):
-                answer = response.get('answer', '')
-                if answer.strip():  # Only analyze non-empty answers
-                    answers.append(answer)
+            responses = survey_data.get('responses', [])
             
-            # Sentiment analysis for all answers at once
-            sentiment_results = []
-            if answers:
-                try:
-                    for answer in answers:
-                        result = get_sentiment(answer)
-                        sentiment_results.append(result)
-
-                except Exception as e:
-                    print(f'Error analyzing sentiment: {e}')
-                    # Fallback to neutral sentiment if analysis fails
-                    sentiment_results = [{'label': 'NEUTRAL'} for _ in answers]
-
-            # Sentiment analysis for each response
-            sentiment_index = 0
-            for response in survey_data.get('responses', []):
-                if response.get('answer', '').strip():  # Only for non-empty answers
-                    if sentiment_index < len(sentiment_results):
-                        sentiment_result = sentiment_results[sentiment_index]
-                        response['SentiAnalysis'] = {
-                            'label': sentiment_result.get('label', 'NEUTRAL')
-                        }
-                        sentiment_index += 1
-                    else:
-                        response['SentiAnalysis'] = {
-                            'label': 'NEUTRAL'
-                        }
+            with ROUTE_STAGE_SECONDS.labels(route='save_survey', stage='sentiment').time():
+                if Config.sentiment_mode == 'async':
+                    # Store immediately; the sentiment worker labels the answers later
+                    pending_items = mark_responses_pending(responses)
                 else:
-                    # For empty answers
-                    response['SentiAnalysis'] = {
-                        'label': 'NEUTRAL'
-                    }
+                    # Answers the sentiment service could not label come back as PENDING work items
+                    pending_items = label_responses(responses)
             
             # Save to MongoDB
-            mongodb_result = mongodb_manager.save_survey(survey_data)
+            with ROUTE_STAGE_SECONDS.labels(route='save_survey', stage='save').time():
+                if Config.survey_write_buffer:
+                    # Written together with other requests' surveys, pending items included
+                    mongodb_result = mongodb_manager.buffer_survey(survey_data, pending_items)
+                else:
+                    mongodb_result = mongodb_manager.save_survey(survey_data)
             
             if mongodb_result["success"]:
+                if pending_items and not Config.survey_write_buffer:
+                    with ROUTE_STAGE_SECONDS.labels(route='save_survey', stage='enqueue').time():
+                        mongodb_manager.enqueue_sentiment_job(survey_data["surveyId"], pending_items)
+                
                 # Total surveys count from MongoDB
-                total_surveys = mongodb_manager.get_surveys_count()
+                with ROUTE_STAGE_SECONDS.labels(route='save_survey', stage='count').time():
+                    total_surveys = mongodb_manager.get_surveys_count()
                 
                 print(f'Survey saved to MongoDB with sentiment analysis. Total surveys: {total_surveys}')
                 return jsonify({
                     'success': True, 
                     'database': 'MongoDB', 
                     'totalSurveys': total_surveys,
-                    'sentimentAnalyzed': True,
+                    'sentimentAnalyzed': not pending_items,
+                    'sentimentPending': len(pending_items),
                     'surveyId': survey_data.get('surveyId', 'unknown')
                 })
             else:
                 # Return error if MongoDB save fails
                 error_msg = f'Failed to save survey to MongoDB: {mongodb_result.get("error", "Unknown error")}'
                 print(error_msg)
+                if mongodb_result.get("busy"):
+                    # Write buffer full: ask the client to come back shortly
+                    return jsonify({'success': False, 'error': error_msg}), 503, {'Retry-After': '1'}
                 return jsonify({
                     'success': False, 
                     'error': error_msg
@@ -83,7 +328,55 @@ def register_routes(app):
             print(f'Error saving survey: {error}')
             return jsonify({'success': False, 'error': str(error)}), 500
 
-    # Serve static files
+    @app.route('/api/save-surveys', methods=['POST'])
+    def save_surveys():
+        try:
+            payload = request.get_json()
+            surveys = payload.get('surveys') if isinstance(payload, dict) else payload
+            
+            if not isinstance(surveys, list):
+                return jsonify({'success': False, 'error': 'Expected a list of surveys'}), 400
+            if len(surveys) > BULK_SAVE_MAX:
+                return jsonify({
+                    'success': False,
+                    'error': f'At most {BULK_SAVE_MAX} surveys per request; use `flask import-surveys` for larger loads'
+                }), 413
+            
+            # Only what will be stored is classified: entries without a surveyId
+            # are rejected by save_surveys, and a repeated surveyId keeps its last version
+            valid = list({
+                survey['surveyId']: survey
+                for survey in surveys if isinstance(survey, dict) and survey.get('surveyId')
+            }.values())
+            
+            # Classified SENTIMENT_CHUNK_SIZE answers per call, each within SENTIMENT_TIMEOUT
+            with ROUTE_STAGE_SECONDS.labels(route='save_surveys', stage='sentiment').time():
+                pending = analyze_surveys(valid, defer=Config.sentiment_mode == 'async')
+            
+            with ROUTE_STAGE_SECONDS.labels(route='save_surveys', stage='save').time():
+                mongodb_result = mongodb_manager.save_surveys(surveys)
+            
+            failed = {error['surveyId'] for error in mongodb_result['errors']}
+            with ROUTE_STAGE_SECONDS.labels(route='save_surveys', stage='enqueue').time():
+                mongodb_manager.enqueue_sentiment_jobs({
+                    survey_id: items for survey_id, items in pending.items() if survey_id not in failed
+                })
+            
+            print(f'Bulk saved {mongodb_result["saved"]} of {len(surveys)} surveys to MongoDB')
+            return jsonify({
+                'success': mongodb_result['success'],
+                'database': 'MongoDB',
+                'saved': mongodb_result['saved'],
+                'upserted': mongodb_result['upserted'],
+                'sentimentPending': sum(len(items) for items in pending.values()),
+                'errors': mongodb_result['errors']
+            }), 200 if mongodb_result['saved'] or not surveys else 500
+            
+        except Exception as error:
+            print(f'Error bulk saving surveys: {error}')
+            return jsonify({'success': False, 'error': str(error)}), 500
+
+    # Pages and static files
     @app.route('/')
     @app.route('/survey')
     def index():
@@ -93,13 +386,20 @@ def register_routes(app):
     def serve_analytics():
         return render_template('analytics.html')
 
-    @app.route('/<path:filename>')
+    @app.route('/static/<path:filename>', endpoint='static')
     def serve_static(filename):
-        return send_from_directory('.', filename)
+        return static_assets.response(filename)
 
     # API endpoints
     @app.route('/api/questions')
     def get_questions():
+        try:
+            question_data = question_pool.get_questions()
+            return jsonify(question_data)
+        except Exception as e:
+            print(f'Error serving questions from pool: {e}')
+        
+        # Pool unavailable (e.g. MongoDB down): generate directly
         try:
             question_data = generate()
             return jsonify(question_data)
@@ -121,7 +421,8 @@ def register_routes(app):
             return jsonify({
                 'connected': is_connected,
                 'surveys_count': surveys_count,
-                'database': os.getenv('MONGODB_DATABASE')
+                'database': os.getenv('MONGODB_DATABASE'),
+                'reconnects': mongodb_manager.reconnects + mongodb_manager.monitor.recoveries
             })
         except Exception as e:
             return jsonify({
@@ -129,6 +430,15 @@ def register_routes(app):
                 'error': str(e)
             }), 500
 
+    @app.route('/api/sentiment/cache')
+    def sentiment_cache_stats():
+        """Hit/miss counters of this worker's sentiment cache"""
+        stats = dict(sentiment_cache.stats)
+        lookups = stats['memory_hits'] + stats['store_hits'] + stats['misses']
+        stats['hitRatio'] = round((lookups - stats['misses']) / lookups, 4) if lookups else 0
+        stats['modelVersion'] = sentiment_cache.model_id
+        return jsonify(stats)
+
     @app.route('/api/surveys/<survey_id>')
     def get_survey_by_id(survey_id):
         """Get a specific survey by ID"""
@@ -145,17 +455,146 @@ def register_routes(app):
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
+    @app.route('/api/analytics/surveys')
+    def list_surveys():
+        """Page through surveys newest first, or stream them all as NDJSON"""
+        try:
+            after = None
+            if request.args.get('cursor'):
+                after = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if request.args.get('format') == 'ndjson':
+            def generate_lines():
+                for survey in mongodb_manager.iter_surveys(after=after, batch_size=SURVEYS_STREAM_BATCH_SIZE):
+                    yield json.dumps(survey, default=str) + '\n'
+            
+            return Response(stream_with_context(generate_lines()), mimetype='application/x-ndjson')
+        
+        limit = request.args.get('limit', SURVEYS_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, SURVEYS_MAX_PAGE_SIZE))
+        
+        result = mongodb_manager.get_surveys_page(limit=limit, after=after)
+        if not result["success"]:
+            return jsonify({'surveys': [], 'error': result.get("error", "Unknown error")}), 500
+        
+        return jsonify({
+            'surveys': result["surveys"],
+            'nextCursor': encode_cursor(result["next"]) if result["next"] else None
+        })
+
+    @app.route('/api/search')
+    def search_answers():
+        """Ranked answers matching `q`, optionally filtered by question, sentiment and date range"""
+        text = request.args.get('q', '').strip()
+        if not text:
+            return jsonify({'error': 'q is required'}), 400
+        
+        label = request.args.get('sentiment', '').upper() or None
+        if label and label not in SENTIMENT_LABELS:
+            return jsonify({'error': f'sentiment must be one of: {", ".join(SENTIMENT_LABELS)}'}), 400
+        
+        # A question is given by catalog ID or by its text
+        question = request.args.get('questionId')
+        if not question and request.args.get('question'):
+            question = question_id(request.args['question'])
+        
+        try:
+            completed = completed_at_query(request.args.get('from'), request.args.get('to'))
+            after = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        limit = request.args.get('limit', SURVEYS_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, SURVEYS_MAX_PAGE_SIZE))
+        
+        result = mongodb_manager.search_answers(
+            text, question_id=question, label=label, completed=completed, limit=limit, after=after
+        )
+        if not result["success"]:
+            return jsonify({'hits': [], 'error': result.get("error", "Unknown error")}), 500
+        
+        return jsonify({
+            'hits': result["hits"],
+            'nextCursor': encode_cursor(result["next"]) if result["next"] else None
+        })
+
+    @app.route('/api/export')
+    def export_surveys():
+        """Download responses as CSV or Parquet, one row per response, streamed from a cursor"""
+        export_format = request.args.get('format', 'csv')
+        compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+        try:
+            query = completed_at_query(request.args.get('from'), request.args.get('to'))
+            chunks = export_chunks(export_format, query, compress=compress, batch_size=SURVEYS_STREAM_BATCH_SIZE)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 501
+        
+        filename = export_filename(export_format, compress, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ'))
+        mimetype = 'application/gzip' if compress and export_format == 'csv' else EXPORT_FORMATS[export_format][0]
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+
+    @app.route('/api/analytics/cache')
+    def analytics_cache_stats():
+        """Hit/miss counters of this worker's analytics response cache"""
+        stats = dict(analytics_cache.stats)
+        requests_served = sum(stats.values())
+        stats['hitRatio'] = round((requests_served - stats['misses']) / requests_served, 4) if requests_served else 0
+        return jsonify(stats)
+
+    @app.route('/api/analytics/stream')
+    def analytics_stream():
+        """Server-Sent Events with the counter deltas of each survey write"""
+        subscriber = live_updates.connect()
+        if subscriber is None:
+            # Every stream holds a thread; dashboards poll until a slot frees up
+            return jsonify({'error': 'Too many live dashboards on this worker'}), 503, {
+                'Retry-After': str(LIVE_STREAM_RETRY_AFTER)
+            }
+        response = Response(
+            stream_with_context(live_updates.stream(subscriber)),
+            mimetype='text/event-stream',
+            # Keep proxies from buffering or caching the stream
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+        # Also frees the slot if the client is gone before the stream starts
+        response.call_on_close(lambda: live_updates.disconnect(subscriber))
+        return response
+
     @app.route('/api/analytics/data')
+    @analytics_cache.cached('analytics-data', params=('from', 'to', 'granularity', 'format'))
     def get_analytics_data():
         try:
-            # Load data from MongoDB
-            mongodb_result = mongodb_manager.get_all_surveys()
+            try:
+                date_range = parse_date_range(request.args)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            response_format = request.args.get('format', 'full')
+            if response_format not in ANALYTICS_FORMATS:
+                return jsonify({'error': f'format must be one of: {", ".join(ANALYTICS_FORMATS)}'}), 400
+            
+            # Read before the counters: live deltas newer than this still apply
+            data_version = mongodb_manager.get_data_version()
             
-            if not mongodb_result["success"]:
-                error_msg = f'Failed to load surveys from MongoDB: {mongodb_result.get("error", "Unknown error")}'
+            # Load pre-aggregated counters from MongoDB; individual surveys are
+            # paged separately through /api/analytics/surveys
+            with ROUTE_STAGE_SECONDS.labels(route='analytics_data', stage='load').time():
+                if date_range:
+                    rollups_result = range_rollups(*date_range)
+                else:
+                    rollups_result = mongodb_manager.get_analytics_rollups()
+            
+            if not rollups_result["success"]:
+                error_msg = f'Failed to load surveys from MongoDB: {rollups_result.get("error", "Unknown error")}'
                 print(error_msg)
                 return jsonify({
-                    'surveys': [],
                     'stats': {
                         'totalResponses': 0,
                         'totalAnswers': 0,
@@ -172,81 +611,41 @@ def register_routes(app):
                     'error': error_msg
                 }), 500
             
-            all_surveys = mongodb_result["surveys"]
-            print(f"Loaded {len(all_surveys)} surveys from MongoDB")
+            if response_format == 'compact':
+                payload = compact_analytics(rollups_result, data_version)
+                with ROUTE_STAGE_SECONDS.labels(route='analytics_data', stage='encode').time():
+                    body = fast_json.dumps(payload)
+                return Response(body, mimetype='application/json')
             
-            # Collect sentiment data from pre-computed SentiAnalysis fields
-            positive_count = 0
-            negative_count = 0
-            neutral_count = 0
-            total_responses_with_sentiment = 0
+            # Sentiment counters are maintained incrementally by save_survey /
+            # delete_survey, so no per-response scan is needed here
+            totals = rollups_result["totals"]
+            positive_count = totals['positive']
+            negative_count = totals['negative']
+            neutral_count = totals['neutral']
+            pending_count = totals['pending']
+            total_responses_with_sentiment = totals['answers']
+            # Answers still waiting for the sentiment worker have no label yet
+            labelled_count = total_responses_with_sentiment - pending_count
             
-            # Also collect data for question-wise analysis
+            # Question-wise analysis; questions arrive ordered by answer count
             question_sentiment = {}
-            question_counts = {}
-            
-            for survey in all_surveys:
-                for response in survey.get('responses', []):
-                    question = response.get('question', 'Unknown')
-                    answer = response.get('answer', '')
-                    
-                    # Count questions
-                    question_counts[question] = question_counts.get(question, 0) + 1
-                    
-                    # Initialize question sentiment tracking
-                    if question not in question_sentiment:
-                        question_sentiment[question] = {
-                            'positive': 0,
-                            'negative': 0,
-                            'neutral': 0,
-                            'total': 0
-                        }
-                    
-                    # Get sentiment from pre-computed SentiAnalysis field
-                    senti_analysis = response.get('SentiAnalysis', {})
-                    sentiment_label = senti_analysis.get('label', 'NEUTRAL')
-                    
-                    if sentiment_label == 'POSITIVE':
-                        positive_count += 1
-                        question_sentiment[question]['positive'] += 1
-                    elif sentiment_label == 'NEGATIVE':
-                        negative_count += 1
-                        question_sentiment[question]['negative'] += 1
-                    else:  # NEUTRAL or any other value
-                        neutral_count += 1
-                        question_sentiment[question]['neutral'] += 1
-                    
-                    question_sentiment[question]['total'] += 1
-                    total_responses_with_sentiment += 1
+            for rollup in rollups_result["questions"]:
+                question = rollup['question']
+                question_sentiment[question] = {
+                    'questionId': rollup['questionId'],
+                    'positive': rollup['positive'],
+                    'negative': rollup['negative'],
+                    'neutral': rollup['neutral'],
+                    'pending': rollup['pending'],
+                    'total': rollup['total']
+                }
             
-            # If no pre-computed sentiment analysis exists, fall back to real-time analysis
-            if total_responses_with_sentiment == 0:
-                print("No pre-computed sentiment found, performing real-time analysis...")
-                all_answers = []
-                for survey in all_surveys:
-                    for response in survey.get('responses', []):
-                        all_answers.append(response.get('answer', ''))
-                
-                if all_answers:
-                    try:
-                        sentiment_results = get_sentiment(all_answers)
-                        for result in sentiment_results:
-                            label = result.get('label', 'NEUTRAL')
-                            if label == 'POSITIVE':
-                                positive_count += 1
-                            elif label == 'NEGATIVE':
-                                negative_count += 1
-                            else:
-                                neutral_count += 1
-                        total_responses_with_sentiment = len(sentiment_results)
-                    except Exception as e:
-                        print(f'Error analyzing sentiment: {e}')
-                        neutral_count = len(all_answers)
-                        total_responses_with_sentiment = len(all_answers)
+            top_questions = rollups_result["questions"][:10]
             
             # Calculate statistics
-            total_surveys = len(all_surveys)
-            positive_percentage = round((positive_count / total_responses_with_sentiment * 100) if total_responses_with_sentiment > 0 else 0)
+            total_surveys = totals['surveys']
+            positive_percentage = round((positive_count / labelled_count * 100) if labelled_count > 0 else 0)
             completion_rate = 100  # Assuming all loaded surveys are complete
             
             # Prepare chart data
@@ -254,38 +653,46 @@ def register_routes(app):
                 'sentimentData': {
                     'positive': positive_count,
                     'negative': negative_count,
-                    'neutral': neutral_count
+                    'neutral': neutral_count,
+                    'pending': pending_count
                 },
                 'questionData': {
-                    'labels': list(question_counts.keys())[:10],  # Limit to top 10 questions
-                    'values': list(question_counts.values())[:10]
+                    # Top 10 most answered questions
+                    'labels': [rollup['question'] for rollup in top_questions],
+                    'values': [rollup['total'] for rollup in top_questions]
                 },
                 'questionSentimentData': question_sentiment  # Question-wise sentiment breakdown
             }
+            if 'timeline' in rollups_result:
+                # Per-period counts for trend charts (only periods with surveys)
+                chart_data['timeline'] = rollups_result['timeline']
             
             stats = {
                 'totalResponses': total_surveys,
                 'totalAnswers': total_responses_with_sentiment,
                 'positiveSentiment': positive_percentage,
                 'completionRate': completion_rate,
+                'pendingAnswers': pending_count,
                 'sentimentBreakdown': {
                     'positive': positive_count,
                     'negative': negative_count,
-                    'neutral': neutral_count
+                    'neutral': neutral_count,
+                    'pending': pending_count
                 },
                 'dataSource': 'MongoDB'
             }
             
-            return jsonify({
-                'surveys': all_surveys,
-                'stats': stats,
-                'chartData': chart_data
-            })
+            with ROUTE_STAGE_SECONDS.labels(route='analytics_data', stage='encode').time():
+                body = fast_json.dumps({
+                    'stats': stats,
+                    'chartData': chart_data,
+                    'dataVersion': data_version
+                })
+            return Response(body, mimetype='application/json')
             
         except Exception as e:
             print(f'Error generating analytics data: {e}')
             return jsonify({
-                'surveys': [],
                 'stats': {
                     'totalResponses': 0,
                     'totalAnswers': 0,
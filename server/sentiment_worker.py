@@ -0,0 +1,54 @@
+import logging
+import time
+from database.db_utils import mongodb_manager
+from utils.resilience import CircuitOpenError
+from utils.sentiment_analysis import SENTIMENT_BREAKER_RESET_SECONDS, SENTIMENT_MODEL_VERSION, get_sentiments
+
+
+def process_sentiment_jobs(batch_size=50, timeout=60):
+    """Claim one batch of queued jobs, classify their answers together and store the labels
+
+    Returns the number of jobs claimed (0 when the queue is empty).
+    """
+    jobs = mongodb_manager.claim_sentiment_jobs(batch_size)
+    if not jobs:
+        return 0
+    
+    texts = [item["answer"] for job in jobs for item in job["items"]]
+    try:
+        results = get_sentiments(texts, timeout=timeout)
+    except CircuitOpenError as e:
+        # The service is known to be down: put the jobs back without using up an attempt
+        logging.warning(f"Sentiment service unavailable, releasing {len(jobs)} jobs: {e}")
+        for job in jobs:
+            mongodb_manager.release_sentiment_job(job, delay=SENTIMENT_BREAKER_RESET_SECONDS)
+        return len(jobs)
+    except Exception as e:
+        logging.error(f"Error labelling {len(texts)} pending answers: {e}")
+        for job in jobs:
+            mongodb_manager.fail_sentiment_job(job, e)
+        return len(jobs)
+    
+    offset = 0
+    for job in jobs:
+        labels = [result["label"] for result in results[offset:offset + len(job["items"])]]
+        offset += len(job["items"])
+        try:
+            mongodb_manager.complete_sentiment_job(job, labels, model=SENTIMENT_MODEL_VERSION)
+        except Exception as e:
+            logging.error(f"Error storing labels for survey {job['surveyId']}: {e}")
+            mongodb_manager.fail_sentiment_job(job, e)
+    
+    logging.info(f"Labelled {len(texts)} answers from {len(jobs)} surveys")
+    return len(jobs)
+
+
+def run_sentiment_worker(batch_size=50, poll_interval=1.0, timeout=60, once=False):
+    """Label PENDING answers until interrupted (or until the queue is empty with once=True)"""
+    while True:
+        claimed = process_sentiment_jobs(batch_size=batch_size, timeout=timeout)
+        if claimed:
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
@@ -3,25 +3,135 @@ let allResponses = [];
 let sentimentChart = null;
 let responseChart = null;
 
+// Survey list pagination state
+let nextCursor = null;
+let loadingPage = false;
+let pageObserver = null;
+
+// Live updates: the latest counters and the data version they reflect
+let dashboard = null;
+let bufferedDeltas = [];
+let refreshing = false;
+// A worker refuses streams beyond LIVE_UPDATES_MAX_STREAMS (Retry-After in server/routes.py)
+const LIVE_STREAM_RETRY_MS = 30000;
+
 // Dashboard
 document.addEventListener('DOMContentLoaded', function() {
+    startLiveUpdates();
     loadAnalyticsData();
 });
 
-// All survey data
-async function loadAnalyticsData() {
-    try {
-        const response = await fetch('/api/analytics/data');
+// Layout of /api/analytics/data?format=compact this page understands
+const COMPACT_ANALYTICS_VERSION = 1;
+
+// Counters and charts from /api/analytics/data
+async function loadDashboard() {
+    let response = await fetch('/api/analytics/data?format=compact');
+    if (!response.ok) {
+        throw new Error('Failed to fetch analytics data');
+    }
+    
+    let data = await response.json();
+    if (data.formatVersion === COMPACT_ANALYTICS_VERSION) {
+        dashboard = decodeCompactAnalytics(data);
+    } else {
+        // Served by a newer release; fall back to the full format
+        response = await fetch('/api/analytics/data');
         if (!response.ok) {
             throw new Error('Failed to fetch analytics data');
         }
+        data = await response.json();
+        dashboard = {
+            stats: data.stats,
+            chartData: data.chartData,
+            version: data.dataVersion || 0
+        };
+    }
+    
+    updateSummaryStats(dashboard.stats);
+    createCharts(dashboard.chartData);
+    
+    // Deltas that arrived while the counters were loading
+    const deltas = bufferedDeltas;
+    bufferedDeltas = [];
+    deltas.forEach(applyDelta);
+}
+
+// Dashboard state ({stats, chartData, version}) from the compact format's parallel arrays
+function decodeCompactAnalytics(data) {
+    const sentimentData = {};
+    data.labels.forEach((label, i) => {
+        sentimentData[label] = data.totals.sentiment[i];
+    });
+    
+    const questions = data.questions;
+    const questionSentimentData = {};
+    questions.ids.forEach((questionId, j) => {
+        const counts = { questionId: questionId, total: questions.totals[j] };
+        data.labels.forEach((label, i) => {
+            counts[label] = questions.sentiment[i][j];
+        });
+        questionSentimentData[questions.texts[j]] = counts;
+    });
+    
+    const chartData = {
+        sentimentData: sentimentData,
+        questionData: {
+            // Top 10 most answered questions
+            labels: questions.texts.slice(0, 10),
+            values: questions.totals.slice(0, 10)
+        },
+        questionSentimentData: questionSentimentData
+    };
+    if (data.timeline) {
+        const timeline = data.timeline;
+        chartData.timeline = {
+            granularity: timeline.granularity,
+            from: timeline.from,
+            to: timeline.to,
+            labels: timeline.periods.map(offset => periodStart(timeline, offset)),
+            surveys: timeline.surveys
+        };
+        data.labels.forEach((label, i) => {
+            chartData.timeline[label] = timeline.sentiment[i];
+        });
+    }
+    
+    const labelled = data.totals.answers - (sentimentData.pending || 0);
+    return {
+        stats: {
+            totalResponses: data.totals.surveys,
+            totalAnswers: data.totals.answers,
+            positiveSentiment: labelled > 0 ? Math.round(sentimentData.positive / labelled * 100) : 0,
+            completionRate: 100,
+            pendingAnswers: sentimentData.pending || 0,
+            sentimentBreakdown: Object.assign({}, sentimentData),
+            dataSource: 'MongoDB'
+        },
+        chartData: chartData,
+        version: data.dataVersion || 0
+    };
+}
+
+// Start (ISO 8601) of the timeline period `offset` granularity units after the first one
+function periodStart(timeline, offset) {
+    const first = new Date(timeline.start * 1000);
+    if (timeline.granularity === 'month') {
+        return new Date(Date.UTC(first.getUTCFullYear(), first.getUTCMonth() + offset, 1)).toISOString();
+    }
+    const unit = { hour: 3600, day: 86400, week: 7 * 86400 }[timeline.granularity];
+    return new Date((timeline.start + offset * unit) * 1000).toISOString();
+}
+
+// All survey data
+async function loadAnalyticsData() {
+    try {
+        await loadDashboard();
         
-        const data = await response.json();
-        allResponses = data.surveys || [];
-        
-        updateSummaryStats(data.stats);
-        createCharts(data.chartData);
-        displayUserResponses(allResponses);
+        // Individual surveys are fetched page by page as the user scrolls
+        allResponses = [];
+        nextCursor = null;
+        await loadNextSurveyPage();
         
     } catch (error) {
         console.error('Error loading analytics data:', error);
@@ -30,6 +140,158 @@ async function loadAnalyticsData() {
     }
 }
 
+// Subscribe to the counter deltas pushed after every survey write
+function startLiveUpdates() {
+    if (!window.EventSource) {
+        return;
+    }
+    
+    const source = new EventSource('/api/analytics/stream');
+    source.addEventListener('delta', event => {
+        const delta = JSON.parse(event.data);
+        if (dashboard && !refreshing) {
+            applyDelta(delta);
+        } else {
+            bufferedDeltas.push(delta);
+        }
+    });
+    // The server could not keep up with this dashboard
+    source.addEventListener('resync', refreshDashboard);
+    // Deltas sent while disconnected are lost; reload once reconnected
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED) {
+            // Refused, so the browser will not retry: poll the counters meanwhile
+            setTimeout(() => {
+                refreshDashboard();
+                startLiveUpdates();
+            }, LIVE_STREAM_RETRY_MS);
+            return;
+        }
+        source.addEventListener('open', refreshDashboard, { once: true });
+    });
+}
+
+// Reload the counters (a cheap 304 when nothing changed)
+async function refreshDashboard() {
+    if (refreshing) {
+        return;
+    }
+    refreshing = true;
+    try {
+        await loadDashboard();
+    } catch (error) {
+        console.error('Error refreshing analytics data:', error);
+    } finally {
+        refreshing = false;
+    }
+}
+
+// Add one survey write's counter changes to the dashboard
+function applyDelta(delta) {
+    if (delta.version <= dashboard.version) {
+        // Already included in the loaded counters
+        return;
+    }
+    if (delta.version !== dashboard.version + 1) {
+        // A write was missed (another worker, a rebuild, a reconnect)
+        refreshDashboard();
+        return;
+    }
+    dashboard.version = delta.version;
+    
+    const stats = dashboard.stats;
+    const sentimentData = dashboard.chartData.sentimentData;
+    const totals = delta.totals || {};
+    stats.totalResponses = (stats.totalResponses || 0) + (totals.surveys || 0);
+    stats.totalAnswers = (stats.totalAnswers || 0) + (totals.answers || 0);
+    ['positive', 'negative', 'neutral', 'pending'].forEach(key => {
+        sentimentData[key] = (sentimentData[key] || 0) + (totals[key] || 0);
+        stats.sentimentBreakdown[key] = sentimentData[key];
+    });
+    stats.pendingAnswers = sentimentData.pending;
+    const labelled = stats.totalAnswers - sentimentData.pending;
+    stats.positiveSentiment = labelled > 0 ? Math.round(sentimentData.positive / labelled * 100) : 0;
+    
+    const questionSentiment = dashboard.chartData.questionSentimentData;
+    (delta.questions || []).forEach(counts => {
+        const current = questionSentiment[counts.question] ||
+            { questionId: counts.questionId, positive: 0, negative: 0, neutral: 0, pending: 0, total: 0 };
+        ['positive', 'negative', 'neutral', 'pending', 'total'].forEach(key => {
+            current[key] += counts[key] || 0;
+        });
+        questionSentiment[counts.question] = current;
+    });
+    
+    updateSummaryStats(stats);
+    updateCharts(sentimentData);
+}
+
+// Next page of individual survey responses
+async function loadNextSurveyPage() {
+    if (loadingPage) {
+        return;
+    }
+    loadingPage = true;
+    
+    try {
+        const params = new URLSearchParams({ limit: 20 });
+        if (nextCursor) {
+            params.set('cursor', nextCursor);
+        }
+        
+        const response = await fetch(`/api/analytics/surveys?${params}`);
+        if (!response.ok) {
+            throw new Error('Failed to fetch survey responses');
+        }
+        
+        const page = await response.json();
+        const isFirstPage = allResponses.length === 0;
+        allResponses = allResponses.concat(page.surveys || []);
+        nextCursor = page.nextCursor;
+        
+        displayUserResponses(page.surveys || [], !isFirstPage);
+        observeLastPage();
+        
+    } catch (error) {
+        console.error('Error loading survey responses:', error);
+        document.getElementById('responses-container').insertAdjacentHTML('beforeend',
+            '<div class="error">Failed to load survey responses. Please try again later.</div>');
+    } finally {
+        loadingPage = false;
+    }
+}
+
+// Load the next page once the end of the list scrolls into view
+function observeLastPage() {
+    const container = document.getElementById('responses-container');
+    let sentinel = document.getElementById('responses-sentinel');
+    
+    if (!nextCursor) {
+        if (sentinel) {
+            sentinel.remove();
+        }
+        return;
+    }
+    
+    if (!sentinel) {
+        sentinel = document.createElement('div');
+        sentinel.id = 'responses-sentinel';
+        sentinel.className = 'loading';
+        sentinel.textContent = 'Loading more responses...';
+    }
+    container.appendChild(sentinel);
+    
+    if (!pageObserver) {
+        pageObserver = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextSurveyPage();
+            }
+        });
+    }
+    pageObserver.disconnect();
+    pageObserver.observe(sentinel);
+}
+
 // Summary statistics
 function updateSummaryStats(stats) {
     document.getElementById('total-responses').textContent = stats.totalResponses || 0;
@@ -49,6 +311,23 @@ function createCharts(chartData) {
     createResponseBarChart(chartData.sentimentData);
 }
 
+// Redraw the charts with new counts, without recreating them
+function updateCharts(sentimentData) {
+    if (sentimentChart) {
+        sentimentChart.data.datasets[0].data = [
+            sentimentData.positive || 0,
+            sentimentData.negative || 0,
+            sentimentData.neutral || 0
+        ];
+        sentimentChart.update('none');
+    }
+    if (responseChart) {
+        const trendData = responseChart.data.datasets[0].data;
+        trendData[trendData.length - 1] = sentimentData.positive || 0;
+        responseChart.update('none');
+    }
+}
+
 // Sentiment pie chart
 function createSentimentPieChart(sentimentData) {
     const ctx = document.getElementById('sentimentPieChart').getContext('2d');
@@ -196,10 +475,10 @@ function createResponseBarChart(sentimentData) {
 }
 
 // Individual user responses display
-function displayUserResponses(responses) {
+function displayUserResponses(responses, append = false) {
     const container = document.getElementById('responses-container');
     
-    if (!responses || responses.length === 0) {
+    if (!append && (!responses || responses.length === 0)) {
         container.innerHTML = '<div class="no-data">No survey responses found.</div>';
         return;
     }
@@ -239,6 +518,10 @@ function displayUserResponses(responses) {
                 sentimentClass = 'sentiment-negative';
                 sentimentIcon = '😞';
                 displayLabel = 'NEGATIVE';
+            } else if (sentimentLabel === 'PENDING') {
+                sentimentClass = 'sentiment-pending';
+                sentimentIcon = '⏳';
+                displayLabel = 'ANALYZING';
             }
             
             html += `
@@ -263,5 +546,14 @@ function displayUserResponses(responses) {
         `;
     });
     
-    container.innerHTML = html;
+    if (append) {
+        const sentinel = document.getElementById('responses-sentinel');
+        if (sentinel) {
+            sentinel.insertAdjacentHTML('beforebegin', html);
+        } else {
+            container.insertAdjacentHTML('beforeend', html);
+        }
+    } else {
+        container.innerHTML = html;
+    }
 }
\ No newline at end of file
@@ -10,6 +10,7 @@
 
 // Survey state
 let questions = [];
+let questionIds = [];
 let currentQuestion = 0;
 let responses = [];
 let useServerSaving = false;
@@ -39,6 +40,7 @@ async function loadQuestions() {
         }
         const data = await response.json();
         questions = data.questions;
+        questionIds = data.questionIds || [];
         console.log(`Loaded ${questions.length} questions from Python API`);
     } catch (error) {
         console.error('Failed to load questions:', error);
@@ -98,6 +100,7 @@ function saveCurrentResponse() {
     
     responses[currentQuestion] = {
         questionNumber: currentQuestion + 1,
+        questionId: questionIds[currentQuestion],
         question: questions[currentQuestion],
         answer: answer,
         timestamp: new Date().toISOString()
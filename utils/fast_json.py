@@ -0,0 +1,20 @@
+import json
+
+try:
+    import orjson  # optional: pip install orjson
+except ImportError:
+    orjson = None
+
+# Reported alongside encode timings so benchmark runs say which one they measured
+ENCODER = "orjson" if orjson is not None else "json"
+
+
+def dumps(value):
+    """Compact UTF-8 JSON of `value` as bytes, encoded with orjson when it is installed
+
+    Only plain JSON types (string keys) are supported, so both encoders
+    produce the same document.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
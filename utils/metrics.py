@@ -0,0 +1,90 @@
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+try:
+    from utils.resilience import CircuitOpenError
+except ImportError:  # run directly from the utils directory (see local_run.py)
+    from resilience import CircuitOpenError
+
+# Latency buckets (seconds) spanning cache hits to slow model / Gemini calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'survey_http_request_seconds', 'HTTP request latency by route',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+ROUTE_STAGE_SECONDS = Histogram(
+    'survey_route_stage_seconds', 'Time spent in each stage of a request handler',
+    ['route', 'stage'], buckets=LATENCY_BUCKETS
+)
+MONGODB_OPERATION_SECONDS = Histogram(
+    'survey_mongodb_operation_seconds', 'MongoDBManager operation latency',
+    ['operation'], buckets=LATENCY_BUCKETS
+)
+MONGODB_RECONNECTS = Counter(
+    'survey_mongodb_reconnects_total', 'MongoDB client re-creations and heartbeat recoveries',
+    ['kind']
+)
+SENTIMENT_SECONDS = Histogram(
+    'survey_sentiment_seconds', 'get_sentiments() latency, overall and for the backend call on cache misses',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+SENTIMENT_TEXTS = Counter(
+    'survey_sentiment_texts_total', 'Texts passed to get_sentiments() by cache outcome',
+    ['result']
+)
+SENTIMENT_FALLBACKS = Counter(
+    'survey_sentiment_fallbacks_total', 'Answers stored without a model label because classification failed',
+    ['fallback', 'reason']
+)
+SENTIMENT_RESILIENCE_EVENTS = Counter(
+    'survey_sentiment_resilience_events_total', 'Sentiment retries, hedged requests and circuit breaker activity',
+    ['event']
+)
+LIVE_DASHBOARDS = Gauge(
+    'survey_live_dashboards', 'Dashboards connected to /api/analytics/stream',
+    multiprocess_mode='livesum'
+)
+LIVE_EVENTS = Counter(
+    'survey_live_events_total', 'Analytics deltas by source and delivery outcome, and refused streams',
+    ['event']
+)
+RESPONSE_CACHE_EVENTS = Counter(
+    'survey_response_cache_events_total', 'Analytics response cache lookups (not_modified, memory_hits, store_hits, misses)',
+    ['event']
+)
+WRITE_BUFFER_BATCH_SIZE = Histogram(
+    'survey_write_buffer_batch_size', 'Surveys written per flush of the survey write buffer',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+WRITE_BUFFER_EVENTS = Counter(
+    'survey_write_buffer_events_total', 'Buffered survey saves by outcome (saved, failed, rejected, timeout)',
+    ['event']
+)
+QUESTION_GENERATION_SECONDS = Histogram(
+    'survey_question_generation_seconds', 'qa_gen.generate() latency (Gemini round trip)',
+    buckets=LATENCY_BUCKETS
+)
+
+
+def failure_reason(error):
+    """Low-cardinality label for an exception"""
+    if isinstance(error, CircuitOpenError):
+        return 'circuit_open'
+    return 'timeout' if isinstance(error, TimeoutError) else 'error'
+
+
+def render():
+    """Current metrics in the Prometheus text format, and its content type
+
+    Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+    (see gunicorn.conf.py), so any worker can answer for all of them.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,16 +1,74 @@
 import os
-from google import genai
-from google.genai import types
+import json
+import threading
 from dotenv import load_dotenv
+
+try:
+    from utils.metrics import QUESTION_GENERATION_SECONDS
+    from utils.questions import question_id
+except ImportError:  # run directly from the utils directory (see local_run.py)
+    from metrics import QUESTION_GENERATION_SECONDS
+    from questions import question_id
 # from database.config import Config
 
 load_dotenv()
 
-def generate():
-    client = genai.Client()
+# Alternative Gemini API endpoint, e.g. the stand-in used by benchmarks/
+GENAI_BASE_URL = os.getenv("GENAI_BASE_URL")
+
+_lock = threading.Lock()
+_client = None
+
+
+def _reset_after_fork():
+    global _lock, _client
+    _lock = threading.Lock()
+    _client = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client():
+    """Gemini client shared by every generate() call in this process"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                from google import genai
+                # GENAI_API_KEY if set, otherwise the SDK's GEMINI_API_KEY / GOOGLE_API_KEY
+                _client = genai.Client(
+                    api_key=os.getenv("GENAI_API_KEY"),
+                    http_options={"base_url": GENAI_BASE_URL} if GENAI_BASE_URL else None
+                )
+    return _client
+
+
+def parse_questions(response_text):
+    """Parse the model's JSON reply into {'questions': [str, ...], 'questionIds': [str, ...]}
+
+    Near duplicates within one reply (same catalog ID) are dropped.
+    """
+    data = json.loads(response_text)
+    questions = data.get("questions") if isinstance(data, dict) else None
+    if not isinstance(questions, list):
+        raise ValueError("Gemini response has no 'questions' list")
+    unique = {}
+    for q in questions:
+        if isinstance(q, str) and q.strip():
+            unique.setdefault(question_id(q), q.strip())
+    return {"questions": list(unique.values()), "questionIds": list(unique)}
+
+
+@QUESTION_GENERATION_SECONDS.time()
+def generate(num=3):
+    # google.genai takes ~0.5s to import; only pay for it when generating
+    from google import genai
+    from google.genai import types
+
+    client = get_client()
     model = "gemini-2.5-flash"
 
-    num = 3 #Number of questions to generate
     company_name = "TSR Corporation" #Company name
     
     contents = [
@@ -59,8 +117,8 @@ def generate():
         contents=contents,
         config=generate_content_config,
     ):
-        response_text += chunk.text
-    return eval(response_text)
+        response_text += chunk.text or ""
+    return parse_questions(response_text)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+import logging
+import os
+import threading
+import time
+
+try:
+    from utils.questions import question_id
+except ImportError:  # run directly from the utils directory (see local_run.py)
+    from questions import question_id
+
+# Questions returned by each /api/questions call
+QUESTION_POOL_SERVE_COUNT = int(os.getenv("QUESTION_POOL_SERVE_COUNT", "3"))
+# Refill in the background once fewer servable questions than this remain
+QUESTION_POOL_LOW_WATERMARK = int(os.getenv("QUESTION_POOL_LOW_WATERMARK", "30"))
+# ...and keep generating until this many are available
+QUESTION_POOL_HIGH_WATERMARK = int(os.getenv("QUESTION_POOL_HIGH_WATERMARK", "60"))
+# Questions generated per Gemini call
+QUESTION_POOL_BATCH_SIZE = int(os.getenv("QUESTION_POOL_BATCH_SIZE", "10"))
+# Retire a question after it has been served this many times (0 = never)
+QUESTION_POOL_MAX_SERVES = int(os.getenv("QUESTION_POOL_MAX_SERVES", "200"))
+# Longest a refill may hold the cross-worker generation lock
+QUESTION_POOL_REFILL_TIMEOUT = int(os.getenv("QUESTION_POOL_REFILL_TIMEOUT", "120"))
+
+
+class QuestionPool:
+    """Serves survey questions from a pre-generated pool stored in MongoDB
+
+    `store` is a MongoDBManager and `generator` is qa_gen.generate. Requests
+    are answered from the pool; when it runs low a single refill is started
+    in the background. Within a process concurrent refills share one
+    generation, and across workers a MongoDB lock lets only one worker call
+    Gemini at a time.
+    """
+
+    def __init__(self, store, generator):
+        self.store = store
+        self.generator = generator
+        self._lock = threading.Lock()
+        self._refill_progress = None
+        self._refill_thread = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # A refill thread running in the parent does not exist in the child
+        self._lock = threading.Lock()
+        self._refill_progress = None
+        self._refill_thread = None
+
+    def get_questions(self):
+        """Return {'questions': [...], 'questionIds': [...]} rotated from the pool"""
+        questions = self.store.take_pool_questions(QUESTION_POOL_SERVE_COUNT, QUESTION_POOL_MAX_SERVES)
+
+        if len(questions) < QUESTION_POOL_SERVE_COUNT:
+            # Cold pool: this request has to wait for the first generation
+            self.refill(wait=True)
+            questions = self.store.take_pool_questions(QUESTION_POOL_SERVE_COUNT, QUESTION_POOL_MAX_SERVES)
+            if not questions:
+                raise Exception("Question pool is empty and could not be refilled")
+        elif self.store.count_pool_questions(QUESTION_POOL_MAX_SERVES) < QUESTION_POOL_LOW_WATERMARK:
+            self.refill(wait=False)
+
+        return {"questions": questions, "questionIds": [question_id(question) for question in questions]}
+
+    def refill(self, wait=False):
+        """Top the pool up to the high watermark, coalescing concurrent calls
+
+        With wait=True, returns as soon as the first batch has been stored (or
+        the refill has ended) instead of waiting for the high watermark.
+        """
+        with self._lock:
+            progress = self._refill_progress
+            if progress is None:
+                progress = self._refill_progress = threading.Event()
+                self._refill_thread = threading.Thread(
+                    target=self._refill, args=(progress,), name="question-refill", daemon=True
+                )
+                self._refill_thread.start()
+
+        if wait:
+            progress.wait(QUESTION_POOL_REFILL_TIMEOUT)
+
+    def wait_for_refill(self):
+        """Block until any in-progress refill of this process has finished"""
+        thread = self._refill_thread
+        if thread is not None:
+            thread.join(QUESTION_POOL_REFILL_TIMEOUT)
+
+    def _refill(self, progress):
+        try:
+            token = self.store.acquire_lock("question_pool_refill", QUESTION_POOL_REFILL_TIMEOUT)
+            if token is None:
+                # Another worker is generating; give it time to fill the shared pool
+                self._wait_for_other_worker()
+                return
+
+            try:
+                for _ in range(QUESTION_POOL_HIGH_WATERMARK // QUESTION_POOL_BATCH_SIZE + 1):
+                    if self.store.count_pool_questions(QUESTION_POOL_MAX_SERVES) >= QUESTION_POOL_HIGH_WATERMARK:
+                        break
+                    generated = self.generator(num=QUESTION_POOL_BATCH_SIZE)
+                    added = self.store.add_pool_questions(generated["questions"])
+                    logging.info(f"Question pool refill added {added} new questions")
+                    progress.set()
+            finally:
+                self.store.release_lock("question_pool_refill", token)
+        except Exception as e:
+            logging.error(f"Error refilling question pool: {e}")
+        finally:
+            with self._lock:
+                self._refill_progress = None
+            progress.set()
+
+    def _wait_for_other_worker(self):
+        deadline = time.monotonic() + QUESTION_POOL_REFILL_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.store.count_pool_questions(QUESTION_POOL_MAX_SERVES) >= QUESTION_POOL_SERVE_COUNT:
+                return
+            time.sleep(0.5)
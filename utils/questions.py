@@ -0,0 +1,27 @@
+import hashlib
+import string
+
+# Stripped from both ends, so "Is X fair?" and "is x fair" share an ID
+_EDGE_CHARACTERS = string.whitespace + string.punctuation
+
+
+def normalize_question(text):
+    """Canonical form of a question: lower case, single spaces, no surrounding punctuation"""
+    return " ".join(text.lower().split()).strip(_EDGE_CHARACTERS)
+
+
+def question_id(text):
+    """Stable catalog ID of a question, derived from its normalized text
+
+    Being content addressed, an ID can be assigned anywhere (a request,
+    the question pool, a migration) without a round trip to the catalog.
+    """
+    return hashlib.sha1(normalize_question(text).encode("utf-8")).hexdigest()[:16]
+
+
+def response_question_id(response):
+    """Catalog ID of the question a stored response answers
+
+    Responses saved before the catalog existed still carry the full text.
+    """
+    return response.get("questionId") or question_id(response.get("question") or "Unknown")
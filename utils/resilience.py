@@ -0,0 +1,68 @@
+import random
+import threading
+import time
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency that is known to be failing"""
+
+
+class CircuitBreaker:
+    """Fails fast after `failure_threshold` consecutive failures
+
+    While open, calls are rejected for `reset_timeout` seconds; then a single
+    trial call is let through (half-open) and its outcome closes the circuit
+    again or re-opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """Whether a call may be attempted now"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        """Count a failure; returns True if this failure opened the circuit"""
+        with self._lock:
+            self.failures += 1
+            was_open = self.opened_at is not None
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+            return not was_open and self.opened_at is not None
+
+    def after_fork(self):
+        """Replace the lock, which may have been held by another thread at fork time"""
+        self._lock = threading.Lock()
+
+
+def backoff_delay(attempt, base, cap):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
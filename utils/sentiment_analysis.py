@@ -1,18 +1,464 @@
-from gradio_client import Client
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
 
-def get_sentiment(context):
-    client = Client("im-tsr/sentiment-analysis")
-    result = client.predict(
-        text=context,
-        api_name="/predict_sentiment"
+# Label of answers stored before the background worker has classified them
+PENDING = 'PENDING'
+
+try:
+    from utils.metrics import (
+        SENTIMENT_FALLBACKS, SENTIMENT_RESILIENCE_EVENTS, SENTIMENT_SECONDS, SENTIMENT_TEXTS, failure_reason
+    )
+    from utils.questions import response_question_id
+    from utils.resilience import CircuitBreaker, CircuitOpenError, backoff_delay
+    from utils.sentiment_cache import SentimentCache
+except ImportError:  # run directly from the utils directory (see local_run.py)
+    from metrics import (
+        SENTIMENT_FALLBACKS, SENTIMENT_RESILIENCE_EVENTS, SENTIMENT_SECONDS, SENTIMENT_TEXTS, failure_reason
     )
+    from questions import response_question_id
+    from resilience import CircuitBreaker, CircuitOpenError, backoff_delay
+    from sentiment_cache import SentimentCache
+
+# Which SentimentBackend classifies answers: 'remote' (Hugging Face Space) or 'local'
+SENTIMENT_BACKEND = os.getenv("SENTIMENT_BACKEND", "remote").lower()
+# Hugging Face Space id, or the URL of any compatible gradio app (e.g. a local stand-in)
+SENTIMENT_SPACE = os.getenv("SENTIMENT_SPACE", "im-tsr/sentiment-analysis")
+# Upper bound on concurrent requests to the Space per worker process, well below
+# the worker's request threads so a burst of saves does not overload the Space;
+# answers still waiting when SENTIMENT_TIMEOUT runs out are stored PENDING
+SENTIMENT_MAX_WORKERS = int(os.getenv("SENTIMENT_MAX_WORKERS", "32"))
+# Model run in-process by the local backend
+SENTIMENT_LOCAL_MODEL = os.getenv("SENTIMENT_LOCAL_MODEL", "finiteautomata/bertweet-base-sentiment-analysis")
+# Local backend micro-batching: largest forward pass and how long to wait to fill it
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "32"))
+SENTIMENT_BATCH_WINDOW_MS = float(os.getenv("SENTIMENT_BATCH_WINDOW_MS", "5"))
+# Deadline budget (seconds) of a whole get_sentiments() call, retries included
+SENTIMENT_TIMEOUT = float(os.getenv("SENTIMENT_TIMEOUT", "15"))
+# Answers per classification call when labelling many surveys at once
+# (analyze_surveys); each call gets its own timeout
+SENTIMENT_CHUNK_SIZE = int(os.getenv("SENTIMENT_CHUNK_SIZE", "100"))
+# HTTP timeout of a single call to the Space, so a hung call frees its thread
+SENTIMENT_CALL_TIMEOUT = float(os.getenv("SENTIMENT_CALL_TIMEOUT", "10"))
+# Extra attempts after a failed classification, with jittered exponential backoff
+SENTIMENT_RETRIES = int(os.getenv("SENTIMENT_RETRIES", "2"))
+SENTIMENT_RETRY_BASE_MS = float(os.getenv("SENTIMENT_RETRY_BASE_MS", "100"))
+SENTIMENT_RETRY_MAX_MS = float(os.getenv("SENTIMENT_RETRY_MAX_MS", "1000"))
+# Consecutive failures that open the circuit, and how long it stays open
+SENTIMENT_BREAKER_FAILURES = int(os.getenv("SENTIMENT_BREAKER_FAILURES", "5"))
+SENTIMENT_BREAKER_RESET_SECONDS = float(os.getenv("SENTIMENT_BREAKER_RESET_SECONDS", "30"))
+# Send a duplicate request for a Space call still running after this long (0 = off)
+SENTIMENT_HEDGE_DELAY_MS = float(os.getenv("SENTIMENT_HEDGE_DELAY_MS", "0"))
+# Part of every cache key; bump it when the model behind the backend changes
+SENTIMENT_MODEL_VERSION = os.getenv(
+    "SENTIMENT_MODEL_VERSION",
+    SENTIMENT_LOCAL_MODEL if SENTIMENT_BACKEND == "local" else SENTIMENT_SPACE
+)
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "10000"))
+SENTIMENT_CACHE_TTL = int(os.getenv("SENTIMENT_CACHE_TTL", str(30 * 24 * 3600)))
+
+# Short model labels (e.g. bertweet's POS/NEG/NEU) mapped to the stored labels
+LABEL_ALIASES = {'POS': 'POSITIVE', 'NEG': 'NEGATIVE', 'NEU': 'NEUTRAL'}
+
+cache = SentimentCache(
+    model_id=SENTIMENT_MODEL_VERSION,
+    max_entries=SENTIMENT_CACHE_SIZE,
+    ttl=SENTIMENT_CACHE_TTL
+)
+
+
+class SentimentBackend:
+    """Classifies a list of texts into POSITIVE / NEGATIVE / NEUTRAL labels"""
+
+    def classify(self, texts, timeout):
+        """Return one label per text, in order; raise TimeoutError past `timeout` seconds"""
+        raise NotImplementedError
+
+
+class RemoteSpaceBackend(SentimentBackend):
+    """Calls the gradio sentiment Space, one request per text on a bounded thread pool
+
+    With `hedge_delay`, a text whose call has not returned after that many
+    seconds gets a duplicate request and the first answer wins, which cuts the
+    tail latency caused by a slow Space replica or a stalled connection.
+    """
+
+    def __init__(self, space=SENTIMENT_SPACE, max_workers=SENTIMENT_MAX_WORKERS,
+                 call_timeout=SENTIMENT_CALL_TIMEOUT, hedge_delay=SENTIMENT_HEDGE_DELAY_MS / 1000):
+        self.space = space
+        self.call_timeout = call_timeout
+        self.hedge_delay = hedge_delay
+        self._client = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sentiment")
+
+    @property
+    def client(self):
+        """Long-lived gradio client, created on first use"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from gradio_client import Client
+                    self._client = Client(
+                        self.space,
+                        verbose=False,
+                        httpx_kwargs={"timeout": self.call_timeout}
+                    )
+        return self._client
+
+    def predict(self, text):
+        return self.client.predict(
+            text=text,
+            api_name="/predict_sentiment"
+        )
+
+    def classify(self, texts, timeout):
+        deadline = time.monotonic() + timeout
+        attempts = [[self._executor.submit(self.predict, text)] for text in texts]
+
+        if self.hedge_delay and self.hedge_delay < timeout:
+            wait([calls[0] for calls in attempts], timeout=self.hedge_delay)
+            for calls, text in zip(attempts, texts):
+                if not calls[0].done():
+                    calls.append(self._executor.submit(self.predict, text))
+                    SENTIMENT_RESILIENCE_EVENTS.labels(event='hedge').inc()
+
+        try:
+            return [self._first_result(calls, deadline) for calls in attempts]
+        except Exception:
+            for calls in attempts:
+                for call in calls:
+                    call.cancel()
+            raise
+
+    def _first_result(self, calls, deadline):
+        pending = set(calls)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError("Sentiment analysis exceeded its deadline")
+            for call in done:
+                if call.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return call.result()
+                error = call.exception()
+        raise error
+
+
+class LocalModelBackend(SentimentBackend):
+    """Runs a transformers model on the CPU of this process with dynamic micro-batching
+
+    Concurrent classify() calls are queued; a single inference thread collects
+    requests for up to `batch_window_ms` (or until `max_batch_size` texts are
+    waiting) and runs them through the model in one batched forward pass.
+    Requires the optional `transformers` and `torch` packages.
+    """
+
+    def __init__(self, model=SENTIMENT_LOCAL_MODEL, max_batch_size=SENTIMENT_BATCH_SIZE,
+                 batch_window_ms=SENTIMENT_BATCH_WINDOW_MS):
+        try:
+            from transformers import pipeline
+        except ImportError:
+            raise RuntimeError("SENTIMENT_BACKEND=local requires: pip install transformers torch")
+
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+        self._pipeline = pipeline("sentiment-analysis", model=model, device=-1)
+        self._requests = queue.Queue()
+        threading.Thread(target=self._run, name="sentiment-batcher", daemon=True).start()
+
+    def classify(self, texts, timeout):
+        future = Future()
+        self._requests.put((texts, future))
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Sentiment analysis of {len(texts)} answers exceeded {timeout}s")
+
+    def _next_batch(self):
+        batch = [self._requests.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.batch_window
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+
+            try:
+                outputs = self._pipeline(texts, batch_size=self.max_batch_size, truncation=True)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, future in batch:
+                labels = [output['label'].upper() for output in outputs[offset:offset + len(request_texts)]]
+                offset += len(request_texts)
+                future.set_result(labels)
+
+
+class ResilientBackend(SentimentBackend):
+    """Wraps a backend with deadline-bounded retries and a circuit breaker
+
+    Failed batches are retried with jittered exponential backoff for as long
+    as the caller's deadline allows. After repeated failures the circuit opens
+    and calls fail immediately with CircuitOpenError until a trial call
+    succeeds, so a down Space costs callers nothing instead of a full timeout.
+    """
+
+    def __init__(self, backend, retries=SENTIMENT_RETRIES, retry_base=SENTIMENT_RETRY_BASE_MS / 1000,
+                 retry_max=SENTIMENT_RETRY_MAX_MS / 1000, breaker=None):
+        self.backend = backend
+        self.retries = retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.breaker = breaker or CircuitBreaker(SENTIMENT_BREAKER_FAILURES, SENTIMENT_BREAKER_RESET_SECONDS)
+
+    def classify(self, texts, timeout):
+        deadline = time.monotonic() + timeout
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                SENTIMENT_RESILIENCE_EVENTS.labels(event='rejected').inc()
+                raise CircuitOpenError("Sentiment service circuit is open")
+
+            try:
+                labels = self.backend.classify(texts, max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                if self.breaker.record_failure():
+                    SENTIMENT_RESILIENCE_EVENTS.labels(event='circuit_open').inc()
+                delay = backoff_delay(attempt, self.retry_base, self.retry_max)
+                if attempt >= self.retries or time.monotonic() + delay >= deadline:
+                    raise
+                logging.warning(f'Sentiment attempt {attempt + 1} failed, retrying in {delay:.2f}s: {e}')
+                SENTIMENT_RESILIENCE_EVENTS.labels(event='retry').inc()
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            return labels
+
+
+BACKENDS = {
+    'remote': RemoteSpaceBackend,
+    'local': LocalModelBackend,
+}
+
+_lock = threading.Lock()
+_backend = None
+
+
+def _reset_after_fork():
+    # Sockets and threads do not survive fork(); each worker builds its own
+    global _lock, _backend
+    _lock = threading.Lock()
+    _backend = None
+    cache.after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_backend():
+    """Sentiment backend selected by SENTIMENT_BACKEND (with retries and a circuit breaker), one per process"""
+    global _backend
+    if _backend is None:
+        with _lock:
+            if _backend is None:
+                if SENTIMENT_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown SENTIMENT_BACKEND '{SENTIMENT_BACKEND}'")
+                _backend = ResilientBackend(BACKENDS[SENTIMENT_BACKEND]())
+    return _backend
+
+
+def get_sentiment(context):
+    """Sentiment of one text, or of each text when given a list"""
+    if isinstance(context, (list, tuple)):
+        return get_sentiments(list(context))
+    return get_sentiments([context])[0]
+
+
+def get_sentiments(texts, timeout=SENTIMENT_TIMEOUT, use_cache=True):
+    """Classify several texts with the configured backend, preserving input order
+
+    Cached labels are reused (unless `use_cache` is False, which classifies
+    every text and refreshes its cache entry) and duplicate texts are only
+    sent once. Raises
+    TimeoutError if the batch does not finish within `timeout` seconds, or the
+    first error raised by an individual call.
+    """
+    if not texts:
+        return []
+
+    with SENTIMENT_SECONDS.labels(stage='total').time():
+        keys = [cache.key(text) for text in texts]
+        labels = cache.get_many(list(dict.fromkeys(keys))) if use_cache else {}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in labels:
+                missing.setdefault(key, text)
+        SENTIMENT_TEXTS.labels(result='cached').inc(len(texts) - len(missing))
+        SENTIMENT_TEXTS.labels(result='classified').inc(len(missing))
+
+        if missing:
+            results = _classify(list(missing.values()), timeout)
+            fresh = {key: result['label'] for key, result in zip(missing, results)}
+            cache.set_many(fresh)
+            labels.update(fresh)
+
+    return [{'label': labels[key]} for key in keys]
+
+
+def _classify(texts, timeout):
+    with SENTIMENT_SECONDS.labels(stage='backend').time():
+        labels = get_backend().classify(texts, timeout)
+    return [{'label': LABEL_ALIASES.get(label, label)} for label in labels]
+
+
+def label_responses(responses):
+    """Attach a SentiAnalysis label to every survey response in place
+
+    If the sentiment service fails (or its circuit is open), the answers are
+    marked PENDING instead and returned as work items for the sentiment queue,
+    so they are labelled later rather than stored as NEUTRAL.
+    """
+    # Sentiment analysis on each response
+    answers = []
+    for response in responses:
+        answer = response.get('answer', '')
+        if answer.strip():  # Only analyze non-empty answers
+            answers.append(answer)
+
+    # Sentiment analysis for all answers at once (classified concurrently)
+    sentiment_results = []
+    if answers:
+        try:
+            sentiment_results = get_sentiments(answers)
+
+        except Exception as e:
+            print(f'Error analyzing sentiment, queueing {len(answers)} answers for re-labelling: {e}')
+            SENTIMENT_FALLBACKS.labels(fallback='pending', reason=failure_reason(e)).inc(len(answers))
+            return mark_responses_pending(responses)
+
+    # Sentiment analysis for each response
+    sentiment_index = 0
+    for response in responses:
+        if response.get('answer', '').strip():  # Only for non-empty answers
+            if sentiment_index < len(sentiment_results):
+                sentiment_result = sentiment_results[sentiment_index]
+                response['SentiAnalysis'] = {
+                    'label': sentiment_result.get('label', 'NEUTRAL'),
+                    'model': SENTIMENT_MODEL_VERSION
+                }
+                sentiment_index += 1
+            else:
+                response['SentiAnalysis'] = {
+                    'label': 'NEUTRAL'
+                }
+        else:
+            # For empty answers
+            response['SentiAnalysis'] = {
+                'label': 'NEUTRAL'
+            }
+    return []
+
+
+def mark_responses_pending(responses):
+    """Mark non-empty answers PENDING in place and return them as work items"""
+    items = []
+    for index, response in enumerate(responses):
+        answer = response.get('answer', '')
+        if answer.strip():
+            response['SentiAnalysis'] = {'label': PENDING}
+            items.append({
+                'index': index,
+                # The rollups of a completed job are moved by question ID
+                'questionId': response_question_id(response),
+                'answer': answer
+            })
+        else:
+            response['SentiAnalysis'] = {'label': 'NEUTRAL'}
+    return items
+
+
+def analyze_surveys(surveys, defer=False, only_missing=False, chunk_size=SENTIMENT_CHUNK_SIZE,
+                    timeout=SENTIMENT_TIMEOUT):
+    """Label the responses of many surveys in place, `chunk_size` answers per classification
+
+    Each chunk must finish within `timeout` seconds. With `defer`, answers
+    are marked PENDING instead and {surveyId: items} is returned for the
+    sentiment queue. `only_missing` keeps existing labels (e.g. surveys
+    exported with their SentiAnalysis). If a chunk fails, its answers and
+    those of the chunks after it are left PENDING and returned for the
+    queue as well.
+    """
+    work = []
+    for survey in surveys:
+        responses = survey.get('responses') or []
+        if only_missing:
+            unlabelled = [index for index, response in enumerate(responses)
+                          if (response.get('SentiAnalysis') or {}).get('label') in (None, PENDING)]
+            items = mark_responses_pending([responses[index] for index in unlabelled])
+            for item in items:
+                item['index'] = unlabelled[item['index']]
+        else:
+            items = mark_responses_pending(responses)
+        if items:
+            work.append((survey, items))
+
+    if defer or not work:
+        return {survey.get('surveyId'): items for survey, items in work}
+
+    entries = [(survey, item) for survey, items in work for item in items]
+    labelled = 0
+    for start in range(0, len(entries), chunk_size):
+        chunk = entries[start:start + chunk_size]
+        try:
+            results = get_sentiments([item['answer'] for _, item in chunk], timeout=timeout)
+        except Exception as e:
+            # Most likely the service is down or overloaded; don't wait on it again
+            print(f'Error analyzing sentiment, queueing {len(entries) - start} answers: {e}')
+            SENTIMENT_FALLBACKS.labels(fallback='pending', reason=failure_reason(e)).inc(len(entries) - start)
+            break
+        for (survey, item), result in zip(chunk, results):
+            survey['responses'][item['index']]['SentiAnalysis'] = {
+                'label': result['label'],
+                'model': SENTIMENT_MODEL_VERSION
+            }
+        labelled += len(chunk)
+
+    pending = {}
+    for survey, item in entries[labelled:]:
+        pending.setdefault(survey.get('surveyId'), []).append(item)
+    return pending
 
-    # Convert string result to dictionary format
-    return {'label': result}
 
 if __name__ == "__main__":
 
     sentences = ["I love programming!", "I hate bugs!", "This is okay."]
     for sentence in sentences:
         result = get_sentiment(sentence)
-        print(f"Input: {sentence} => Sentiment: {result}")
\ No newline at end of file
+        print(f"Input: {sentence} => Sentiment: {result}")
+    print(get_sentiments(sentences))
@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Canonical form of an answer used for cache lookups"""
+    return " ".join(text.lower().split())
+
+
+class SentimentCache:
+    """Two-tier cache of sentiment labels keyed on normalized answer text
+
+    The first tier is an in-process LRU. The optional second tier is any object
+    with `get_cached_sentiments(keys)` / `cache_sentiments(labels)` methods
+    (MongoDBManager provides them), shared by every worker. Keys include the
+    model identifier, so changing the model invalidates all previous entries.
+    """
+
+    def __init__(self, model_id, max_entries=10000, ttl=30 * 24 * 3600, store=None):
+        self.model_id = model_id
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "store_hits": 0, "misses": 0}
+
+    def key(self, text):
+        """Content address of a text for the current model"""
+        payload = f"{self.model_id}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: label} for every key found in either tier"""
+        found = {}
+        now = time.monotonic()
+
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                label, expires_at = entry
+                if expires_at < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = label
+            self.stats["memory_hits"] += len(found)
+
+        remaining = [key for key in keys if key not in found]
+        if remaining and self.store is not None:
+            try:
+                from_store = self.store.get_cached_sentiments(remaining)
+            except Exception as e:
+                logging.error(f"Error reading sentiment cache store: {e}")
+                from_store = {}
+            self._remember(from_store)
+            found.update(from_store)
+            with self._lock:
+                self.stats["store_hits"] += len(from_store)
+
+        with self._lock:
+            self.stats["misses"] += len(keys) - len(found)
+        return found
+
+    def set_many(self, labels):
+        """Store freshly computed {key: label} results in both tiers"""
+        if not labels:
+            return
+        self._remember(labels)
+        if self.store is not None:
+            try:
+                self.store.cache_sentiments(labels)
+            except Exception as e:
+                logging.error(f"Error writing sentiment cache store: {e}")
+
+    def after_fork(self):
+        """Replace the lock, which may have been held by another thread at fork time"""
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drop the in-process tier"""
+        with self._lock:
+            self._entries.clear()
+
+    def _remember(self, labels):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, label in labels.items():
+                self._entries[key] = (label, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)